@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the personal data helpers
+"""
+import io
+import logging
+import os
+import re
+import subprocess
+import sys
+import time
+from typing import Callable, List, TextIO
+
+from filtered_logger import filter_datum, get_logger
+
+
+def legacy_filter_datum(fields: List[str], redaction: str, message: str,
+                        separator: str) -> str:
+    """ filter_datum as it was before the single-pass engine """
+    for f in fields:
+        message = re.sub(rf"{f}=(.*?)\{separator}",
+                         f'{f}={redaction}{separator}', message)
+    return message
+
+
+def lines_per_sec(func: Callable, fields: List[str], lines: List[str],
+                  repeat: int = 3) -> float:
+    """ Best throughput of func over lines, in lines per second """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for line in lines:
+            func(fields, "***", line, ";")
+        best = min(best, time.perf_counter() - start)
+    return len(lines) / best
+
+
+def bench_filter_datum() -> None:
+    """ filter_datum: legacy vs single-pass, by field count and length """
+    print(f"{'fields':>7} {'line len':>9} {'legacy l/s':>12} "
+          f"{'single l/s':>12} {'speedup':>8}")
+    for n_fields in (5, 50, 500):
+        fields = [f"field{i}" for i in range(n_fields)]
+        for n_pairs in (8, 200):
+            line = "".join(f"field{i * 7 % (n_fields * 2)}=value{i};"
+                           for i in range(n_pairs))
+            lines = [line] * max(20, 20000 // (n_fields * n_pairs // 8))
+            old = lines_per_sec(legacy_filter_datum, fields, lines)
+            new = lines_per_sec(filter_datum, fields, lines)
+            print(f"{n_fields:>7} {len(line):>9} {old:>12.0f} "
+                  f"{new:>12.0f} {new / old:>7.1f}x")
+
+
+def slow_pipe(chunk: int = 4096, pause: float = 0.002) -> TextIO:
+    """ Write end of a pipe read by a child process taking chunk bytes
+    every pause seconds: writes block once the pipe buffer is full, like
+    a slow disk, terminal or log shipper
+    """
+    reader = subprocess.Popen(
+        [sys.executable, "-c",
+         "import sys, time\n"
+         f"while sys.stdin.buffer.read({chunk}): time.sleep({pause})"],
+        stdin=subprocess.PIPE)
+    stream = io.TextIOWrapper(reader.stdin)
+    stream.reader = reader
+    return stream
+
+
+def bench_logger(calls: int = 5000) -> None:
+    """ get_logger: caller-side latency per log call in a burst of calls
+    (fitting the default queue), sync vs queued, to /dev/null and to a
+    slow pipe; "drain ms" is the time close() then takes to write what
+    is still queued
+    """
+    message = "name=Bob; email=bob@dylan.com; ssn=000-123-0000; " \
+        "password=bobby2019; phone=555-0100; ip=10.0.0.1;"
+    modes = {"sync": {}, "queue/block": {"PERSONAL_DATA_LOG_ASYNC": "1"},
+             "queue/drop": {"PERSONAL_DATA_LOG_ASYNC": "1",
+                            "PERSONAL_DATA_LOG_QUEUE_SIZE": "1000",
+                            "PERSONAL_DATA_LOG_QUEUE_FULL": "drop"}}
+    streams = {"devnull": lambda: open(os.devnull, "w"),
+               "slow pipe": slow_pipe}
+    print(f"{'stream':>9} {'mode':>12} {'mean us':>8} {'p99 us':>8} "
+          f"{'drain ms':>9} {'dropped':>8}")
+    for name, open_stream in streams.items():
+        for mode, env in modes.items():
+            stream = open_stream()
+            os.environ.update(env)
+            logger = logging.getLogger("user_data")
+            logger.handlers.clear()
+            handler = get_logger().handlers[0]
+            listener = getattr(handler, "listener", None)
+            (listener.handlers[0] if listener else handler).setStream(stream)
+            latencies = []
+            for _ in range(calls):
+                start = time.perf_counter()
+                logger.info(message)
+                latencies.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            handler.close()
+            drain = time.perf_counter() - start
+            for key in env:
+                del os.environ[key]
+            stream.close()
+            if hasattr(stream, "reader"):
+                stream.reader.wait()
+            latencies.sort()
+            print(f"{name:>9} {mode:>12} "
+                  f"{sum(latencies) / calls * 1e6:>8.1f} "
+                  f"{latencies[int(calls * 0.99)] * 1e6:>8.1f} "
+                  f"{drain * 1e3:>9.1f} "
+                  f"{getattr(handler, 'dropped', 0):>8}")
+
+
+BENCHMARKS = {
+    "filter_datum": bench_filter_datum,
+    "logger": bench_logger,
+}
+
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or BENCHMARKS:
+        print(f"== {name}")
+        BENCHMARKS[name]()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Connection pooling
+"""
+
+
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from queue import Empty, LifoQueue
+from typing import Any, Dict, Iterator, Tuple
+
+
+class SQLiteAdapter:
+    """ Opens and health-checks sqlite3 connections, a local stand-in
+    for the MySQL database behind get_db.
+    """
+
+    def __init__(self, database: str = ":memory:"):
+        """ Init """
+        self.database = database
+
+    def connect(self) -> sqlite3.Connection:
+        """ Open a new connection """
+        return sqlite3.connect(self.database, check_same_thread=False)
+
+    def is_alive(self, conn: sqlite3.Connection) -> bool:
+        """ Health check run on checkout """
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+
+class ConnectionPool:
+    """ Fixed-size pool of connections opened through an adapter
+    (any object with connect() and is_alive(conn) methods).
+
+    Idle connections are health-checked on checkout and replaced when
+    they fail or are older than recycle seconds. Checkout waits up to
+    timeout seconds for a connection when all size are in use.
+    """
+
+    def __init__(self, adapter: Any, size: int = 5, timeout: float = 30.0,
+                 recycle: float = 3600.0):
+        """ Init """
+        self.adapter = adapter
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.hits = 0
+        self.misses = 0
+        self._opened = 0
+        self._idle: LifoQueue = LifoQueue()
+        self._created: Dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    def _open(self) -> Tuple[Any, float]:
+        """ Open a new connection for a pool slot, counted as a miss """
+        with self._lock:
+            self.misses += 1
+        try:
+            return self.adapter.connect(), time.monotonic()
+        except Exception:
+            with self._lock:
+                self._opened -= 1
+            raise
+
+    def _discard(self, conn: Any) -> None:
+        """ Close a connection that leaves the pool """
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def acquire(self) -> Any:
+        """ Check a connection out of the pool """
+        with self._lock:
+            can_open = self._idle.empty() and self._opened < self.size
+            if can_open:
+                self._opened += 1
+        if can_open:
+            conn, created = self._open()
+        else:
+            try:
+                conn, created = self._idle.get(timeout=self.timeout)
+            except Empty:
+                raise TimeoutError("no connection available after "
+                                   f"{self.timeout}s") from None
+            if conn is None or time.monotonic() - created > self.recycle \
+                    or not self.adapter.is_alive(conn):
+                if conn is not None:
+                    self._discard(conn)
+                conn, created = self._open()
+            else:
+                with self._lock:
+                    self.hits += 1
+        self._created[id(conn)] = created
+        return conn
+
+    def release(self, conn: Any) -> None:
+        """ Return a connection to the pool; a connection that cannot be
+        rolled back is closed and its slot reopened on next checkout.
+        """
+        created = self._created.pop(id(conn), 0.0)
+        try:
+            conn.rollback()
+        except Exception:
+            self._discard(conn)
+            conn = None
+        self._idle.put((conn, created))
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """ with pool.connection() as conn: ... """
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def stats(self) -> Dict[str, int]:
+        """ Pool counters """
+        idle = self._idle.qsize()
+        return {"size": self.size, "opened": self._opened, "idle": idle,
+                "in_use": self._opened - idle, "hits": self.hits,
+                "misses": self.misses}
+
+    def close(self) -> None:
+        """ Close every idle connection """
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except Empty:
+                break
+            if conn is not None:
+                self._discard(conn)
+            with self._lock:
+                self._opened -= 1
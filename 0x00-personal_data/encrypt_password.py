@@ -4,17 +4,124 @@ Encrypting passwords
 """
 
 
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable, List, Optional, Tuple
+
 import bcrypt
 
+_target_cost: Optional[int] = None
+_executor: Optional[ThreadPoolExecutor] = None
+_cost_lock = threading.Lock()
+_pool_lock = threading.Lock()
+
+
+def calibrate_cost(budget: float = 0.25, min_cost: int = 12,
+                   max_cost: int = 16) -> int:
+    """
+    Highest bcrypt cost whose hash takes at most budget seconds on this
+    machine, never below min_cost (bcrypt's default of 12, so a slow
+    or busy machine doesn't weaken the hashes)
+    """
+    cost = min_cost
+    password = b"calibration"
+    while cost < max_cost:
+        start = time.perf_counter()
+        bcrypt.hashpw(password, bcrypt.gensalt(rounds=cost))
+        # Each extra round doubles the work
+        if (time.perf_counter() - start) * 2 > budget:
+            break
+        cost += 1
+    return cost
+
+
+def target_cost() -> int:
+    """
+    Cost used for new hashes: PERSONAL_DATA_BCRYPT_COST if set, else
+    calibrated once against PERSONAL_DATA_BCRYPT_BUDGET_MS (250ms)
+    """
+    global _target_cost
+    with _cost_lock:
+        if _target_cost is None:
+            cost = os.environ.get("PERSONAL_DATA_BCRYPT_COST")
+            if cost:
+                _target_cost = int(cost)
+            else:
+                budget = os.environ.get("PERSONAL_DATA_BCRYPT_BUDGET_MS",
+                                        250)
+                _target_cost = calibrate_cost(int(budget) / 1000)
+    return _target_cost
+
 
 def hash_password(password: str) -> bytes:
     """
     Salted pass generation
     """
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    return bcrypt.hashpw(password.encode('utf-8'),
+                         bcrypt.gensalt(rounds=target_cost()))
 
 
 def is_valid(hashed_password: bytes, password: str) -> bool:
     """ is valid?
     """
     return bcrypt.checkpw(password.encode('utf-8'), hashed_password)
+
+
+def needs_rehash(hashed_password: bytes) -> bool:
+    """
+    Whether a stored hash uses a cost below target_cost(), so callers
+    can rehash the password after a successful is_valid
+    """
+    try:
+        cost = int(hashed_password.split(b"$")[2])
+    except (IndexError, ValueError):
+        return True
+    return cost < target_cost()
+
+
+def _pool() -> ThreadPoolExecutor:
+    """
+    Shared hashing pool, PERSONAL_DATA_BCRYPT_WORKERS threads (one per
+    core by default): bcrypt releases the GIL, so hashes run in parallel
+    """
+    global _executor
+    with _pool_lock:
+        if _executor is None:
+            workers = os.environ.get("PERSONAL_DATA_BCRYPT_WORKERS")
+            _executor = ThreadPoolExecutor(
+                int(workers) if workers else os.cpu_count(),
+                thread_name_prefix="bcrypt")
+    return _executor
+
+
+def hash_password_async(password: str) -> Future:
+    """
+    hash_password on the hashing pool; await it from asyncio code with
+    asyncio.wrap_future
+    """
+    target_cost()  # calibrate here, not concurrently in the workers
+    return _pool().submit(hash_password, password)
+
+
+def is_valid_async(hashed_password: bytes, password: str) -> Future:
+    """
+    is_valid on the hashing pool
+    """
+    return _pool().submit(is_valid, hashed_password, password)
+
+
+def hash_passwords(passwords: Iterable[str]) -> List[bytes]:
+    """
+    Hashes many passwords at once on the hashing pool
+    """
+    target_cost()
+    return list(_pool().map(hash_password, passwords))
+
+
+def are_valid(checks: Iterable[Tuple[bytes, str]]) -> List[bool]:
+    """
+    is_valid for many (hashed_password, password) pairs on the hashing pool
+    """
+    return list(_pool().map(lambda check: is_valid(*check), checks))
@@ -4,22 +4,76 @@ Personal data
 """
 
 
+import argparse
 import logging
 import os
 import re
-from typing import List
+import sys
+from functools import lru_cache
+from itertools import islice
+from logging.handlers import QueueHandler, QueueListener
+from queue import Full, Queue
+from typing import (Any, Iterable, Iterator, List, Optional, Pattern, TextIO,
+                    Tuple)
 import mysql.connector
+from db_pool import ConnectionPool
 
 PII_FIELDS = ("name", "email", "phone", "ssn", "password")
 
 
+def _fields_trie(fields: Tuple[str, ...]) -> str:
+    """ Folds plain field names into a prefix-trie regex so each position
+    of the message is tested once per character instead of once per field
+    """
+    trie: dict = {}
+    for f in fields:
+        node = trie
+        for char in f:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        """ Turns a trie node into a regex fragment """
+        branches = [char + build(child)
+                    for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else \
+            "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+@lru_cache(maxsize=128)
+def _redaction_pattern(fields: Tuple[str, ...],
+                       separator: str) -> Optional[Pattern[str]]:
+    """ Compiles (once) the pattern redacting all fields in one pass.
+    Group 1 captures the "field=" prefix kept in the output.
+    None when a field is itself a regex and must be applied on its own.
+    """
+    if any(re.escape(f) != f for f in fields):
+        return None
+    sep = re.escape(separator)
+    value = rf"[^{sep}\n]*" if len(separator) == 1 else ".*?"
+    return re.compile(rf"({_fields_trie(fields)}=){value}{sep}")
+
+
 def filter_datum(fields: List[str], redaction: str, message: str,
                  separator: str) -> str:
     """ Replacing """
-    for f in fields:
-        message = re.sub(rf"{f}=(.*?)\{separator}",
-                         f'{f}={redaction}{separator}', message)
-    return message
+    if not fields:
+        return message
+    pattern = _redaction_pattern(tuple(fields), separator)
+    if pattern is None:
+        for f in fields:
+            message = re.sub(rf"{f}=(.*?)\{separator}",
+                             f'{f}={redaction}{separator}', message)
+        return message
+    tail = redaction + separator
+    parts = pattern.split(message)
+    parts[1::2] = [prefix + tail for prefix in parts[1::2]]
+    return "".join(parts)
 
 
 class RedactingFormatter(logging.Formatter):
@@ -40,15 +94,84 @@ class RedactingFormatter(logging.Formatter):
                             super().format(record), self.SEPARATOR)
 
 
+class DrainingQueueListener(QueueListener):
+    """ QueueListener whose stop() waits for room in a full queue instead
+    of failing, so every queued record is written before it returns.
+    """
+
+    def enqueue_sentinel(self) -> None:
+        """ Enqueue the stop sentinel, blocking if needed """
+        self.queue.put(self._sentinel)
+
+
+class BoundedQueueHandler(QueueHandler):
+    """ QueueHandler over a bounded queue: when the queue is full it
+    either blocks the caller or drops the record (and counts it).
+    Records are redacted and written by a listener thread to handler.
+    """
+
+    def __init__(self, handler: logging.Handler, size: int,
+                 block: bool = True):
+        """ Init """
+        super().__init__(Queue(size))
+        self.block = block
+        self.dropped = 0
+        self.listener = DrainingQueueListener(self.queue, handler)
+        self.listener.start()
+        self.listening = True
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        """ Filter and emit without the handler lock: the queue is
+        already thread-safe
+        """
+        rv = self.filter(record)
+        if rv:
+            self.emit(record)
+        return rv
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """ Only merge args/exc_info in the caller; format in the listener
+        """
+        if record.args or record.exc_info or record.stack_info:
+            return super().prepare(record)
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """ Enqueue, applying the queue-full policy """
+        try:
+            self.queue.put(record, block=self.block)
+        except Full:
+            self.dropped += 1
+
+    def close(self) -> None:
+        """ Drain the queue and stop the listener """
+        if self.listening:
+            self.listening = False
+            self.listener.stop()
+        super().close()
+
+
 def get_logger() -> logging.Logger:
     """ Implementing a logger.
+    Idempotent: the handlers are only attached on the first call.
+    With PERSONAL_DATA_LOG_ASYNC set, records go through a bounded queue
+    (PERSONAL_DATA_LOG_QUEUE_SIZE, PERSONAL_DATA_LOG_QUEUE_FULL=block|drop)
+    and are redacted and written by a background listener thread: worth
+    it when writing to the stream can block, not for a fast one.
     """
 
     logger = logging.getLogger("user_data")
+    if logger.handlers:
+        return logger
     logger.setLevel(logging.INFO)
     logger.propagate = False
     handler = logging.StreamHandler()
     handler.setFormatter(RedactingFormatter(PII_FIELDS))
+    if os.environ.get("PERSONAL_DATA_LOG_ASYNC", "").lower() in \
+            ("1", "true", "yes"):
+        size = int(os.environ.get("PERSONAL_DATA_LOG_QUEUE_SIZE", 10000))
+        policy = os.environ.get("PERSONAL_DATA_LOG_QUEUE_FULL", "block")
+        handler = BoundedQueueHandler(handler, size, policy != "drop")
     logger.addHandler(handler)
     return logger
 
@@ -68,19 +191,101 @@ def get_db() -> mysql.connector.connection.MySQLConnection:
     return conn
 
 
+class MySQLAdapter:
+    """ Pool adapter opening connections through get_db """
+
+    def connect(self) -> mysql.connector.connection.MySQLConnection:
+        """ Open a new connection """
+        return get_db()
+
+    def is_alive(self, conn: mysql.connector.connection.MySQLConnection
+                 ) -> bool:
+        """ Health check run on checkout (pings the server) """
+        return conn.is_connected()
+
+
+_db_pool: Optional[ConnectionPool] = None
+
+
+def get_db_pool(adapter: Any = None) -> ConnectionPool:
+    """ Shared connection pool, sized by PERSONAL_DATA_DB_POOL_SIZE,
+    PERSONAL_DATA_DB_POOL_TIMEOUT and PERSONAL_DATA_DB_POOL_RECYCLE.
+    adapter defaults to MySQLAdapter (pass a SQLiteAdapter for tests).
+    """
+    global _db_pool
+    if _db_pool is None:
+        _db_pool = ConnectionPool(
+            adapter or MySQLAdapter(),
+            size=int(os.environ.get("PERSONAL_DATA_DB_POOL_SIZE", 5)),
+            timeout=float(os.environ.get("PERSONAL_DATA_DB_POOL_TIMEOUT",
+                                         30)),
+            recycle=float(os.environ.get("PERSONAL_DATA_DB_POOL_RECYCLE",
+                                         3600)))
+    return _db_pool
+
+
+def iter_rows(db, query: str = "SELECT * FROM users;",
+              batch_size: int = 1000) -> Iterator[str]:
+    """ Streams rows of query as "column=value;" messages, fetching
+    batch_size rows at a time so the result set is never held in memory.
+    """
+    cursor = db.cursor()
+    try:
+        cursor.execute(query)
+        columns = [f"{col[0]}=" for col in cursor.description]
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield " ".join(f"{col}{value};" for col, value
+                               in zip(columns, row))
+    finally:
+        cursor.close()
+
+
+def redact_rows(messages: Iterable[str],
+                formatter: logging.Formatter) -> Iterator[str]:
+    """ Formats (and so redacts) each message as a user_data log line """
+    for message in messages:
+        record = logging.LogRecord("user_data", logging.INFO, __file__, 0,
+                                   message, None, None)
+        yield formatter.format(record) + "\n"
+
+
+def export(db, out: TextIO, batch_size: int = 1000) -> int:
+    """ Writes the redacted users table to out in batch_size bulk writes.
+    Return: the number of rows written
+    """
+    lines = redact_rows(iter_rows(db, batch_size=batch_size),
+                        RedactingFormatter(PII_FIELDS))
+    count = 0
+    while True:
+        batch = list(islice(lines, batch_size))
+        if not batch:
+            break
+        out.write("".join(batch))
+        count += len(batch)
+    out.flush()
+    return count
+
+
 def main() -> None:
     """ Implement a main function
     """
+    parser = argparse.ArgumentParser(description="Export redacted users")
+    parser.add_argument("-o", "--output", help="file to write, or stdout")
+    parser.add_argument("-b", "--batch-size", type=int, default=1000)
+    args = parser.parse_args()
     db = get_db()
-    cursor = db.cursor()
-    cursor.execute("SELECT * FROM users;")
-    for row in cursor:
-        message = f"name={row[0]}; email={row[1]}; phone={row[2]}; " +\
-            f"ssn={row[3]}; password={row[4]};ip={row[5]}; " +\
-            f"last_login={row[6]}; user_agent={row[7]};"
-        print(message)
-    cursor.close()
-    db.close()
+    try:
+        if args.output:
+            with open(args.output, "w", buffering=1 << 20) as out:
+                export(db, out, args.batch_size)
+        else:
+            export(db, sys.stdout, args.batch_size)
+    finally:
+        db.close()
 
 
 if __name__ == '__main__':
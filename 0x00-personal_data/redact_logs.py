@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Redacts PII from large log files on every core:
+    ./redact_logs.py INPUT [-o OUTPUT] [-w WORKERS] [-c CHUNK_MB]
+
+The input is memory-mapped and cut into chunks at line boundaries; each
+worker maps the same file and redacts its own byte range, and chunks are
+written back in their original order. Throughput is reported on stderr.
+"""
+
+
+import argparse
+import mmap
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Iterator, List, Tuple
+
+from filtered_logger import PII_FIELDS, RedactingFormatter, filter_datum
+
+
+def chunk_bounds(path: str, chunk_size: int) -> Iterator[Tuple[int, int]]:
+    """ Yields (start, end) byte ranges of about chunk_size bytes, each
+    ending right after a newline (or at the end of the file)
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        return
+    with open(path, "rb") as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start = 0
+        while start < size:
+            end = min(start + chunk_size, size)
+            if end < size:
+                newline = mm.find(b"\n", end - 1)
+                end = size if newline == -1 else newline + 1
+            yield start, end
+            start = end
+
+
+def redact_chunk(path: str, start: int, end: int, fields: List[str],
+                 redaction: str, separator: str) -> Tuple[bytes, int]:
+    """ Redacts bytes [start, end) of path.
+    Return: the redacted bytes and the number of lines in them
+    """
+    with open(path, "rb") as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        data = mm[start:end]
+    # The redaction pattern never crosses a newline, so a whole chunk
+    # gives the same result as filtering it line by line
+    text = data.decode("utf-8", "surrogateescape")
+    text = filter_datum(fields, redaction, text, separator)
+    return text.encode("utf-8", "surrogateescape"), data.count(b"\n")
+
+
+def redacted_chunks(path: str, workers: int, chunk_size: int,
+                    *args: object) -> Iterator[Tuple[int, bytes, int]]:
+    """ Yields (bytes read, redacted bytes, lines) for each chunk of path
+    in file order, redacting up to workers chunks in parallel
+    """
+    bounds = chunk_bounds(path, chunk_size)
+    if workers <= 1:
+        for start, end in bounds:
+            yield (end - start, *redact_chunk(path, start, end, *args))
+        return
+    with ProcessPoolExecutor(workers) as executor:
+        # At most two chunks in flight per worker keeps memory bounded
+        pending: deque = deque()
+        for start, end in bounds:
+            pending.append((end - start, executor.submit(
+                redact_chunk, path, start, end, *args)))
+            if len(pending) >= 2 * workers:
+                size, future = pending.popleft()
+                yield (size, *future.result())
+        while pending:
+            size, future = pending.popleft()
+            yield (size, *future.result())
+
+
+def redact_file(path: str, out: BinaryIO, workers: int, chunk_size: int,
+                fields: List[str], redaction: str,
+                separator: str) -> Tuple[int, int]:
+    """ Redacts path into out, keeping the line order.
+    Return: (bytes read, lines written)
+    """
+    read = lines = 0
+    for size, data, count in redacted_chunks(path, workers, chunk_size,
+                                             fields, redaction, separator):
+        out.write(data)
+        read, lines = read + size, lines + count
+    return read, lines
+
+
+def main() -> None:
+    """ Command line entry point """
+    parser = argparse.ArgumentParser(description="Redact PII from log files")
+    parser.add_argument("input")
+    parser.add_argument("-o", "--output", help="file to write, or stdout")
+    parser.add_argument("-w", "--workers", type=int,
+                        default=os.cpu_count() or 1)
+    parser.add_argument("-c", "--chunk-mb", type=float, default=8)
+    parser.add_argument("-f", "--fields", nargs="+", default=PII_FIELDS)
+    parser.add_argument("-s", "--separator",
+                        default=RedactingFormatter.SEPARATOR)
+    parser.add_argument("-r", "--redaction",
+                        default=RedactingFormatter.REDACTION)
+    args = parser.parse_args()
+
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    begin = time.perf_counter()
+    try:
+        read, lines = redact_file(args.input, out, args.workers,
+                                  int(args.chunk_mb * (1 << 20)),
+                                  list(args.fields), args.redaction,
+                                  args.separator)
+    finally:
+        if args.output:
+            out.close()
+        else:
+            out.flush()
+    elapsed = max(time.perf_counter() - begin, 1e-9)
+    mb = read / (1 << 20)
+    print(f"{lines} lines, {mb:.1f} MB in {elapsed:.2f}s with "
+          f"{args.workers} workers: {mb / elapsed:.1f} MB/s, "
+          f"{lines / elapsed:.0f} lines/s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
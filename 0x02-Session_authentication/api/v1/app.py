@@ -3,8 +3,9 @@
 Route module for the API
 """
 from os import getenv
+from api.v1.auth.path_matcher import PathMatcher
 from api.v1.views import app_views
-from flask import Flask, jsonify, abort, request
+from flask import Flask, jsonify, abort, g, request
 from flask_cors import (CORS, cross_origin)
 import os
 
@@ -27,29 +28,42 @@ elif getenv("AUTH_TYPE") == 'session_exp_auth':
 elif getenv("AUTH_TYPE") == 'session_db_auth':
     from api.v1.auth.session_db_auth import SessionDBAuth
     auth = SessionDBAuth()
+elif getenv("AUTH_TYPE") == 'token_auth':
+    from api.v1.auth.token_auth import TokenAuth
+    auth = TokenAuth()
 else:
     from api.v1.auth.auth import Auth
     auth = Auth()
 
+AUTH_TIMINGS = bool(getenv("AUTH_TIMINGS"))
+excluded_paths = PathMatcher(
+    entry.strip() for entry in getenv(
+        "AUTH_EXCLUDED_PATHS",
+        "/api/v1/status/,/api/v1/unauthorized/,/api/v1/forbidden/,"
+        "/api/v1/auth_session/login/").split(",") if entry.strip())
+
 
 @app.before_request
 def request_filter() -> None:
     """ Checks if request needs authorization
     """
-    excluded_paths = [
-        '/api/v1/status/',
-        '/api/v1/unauthorized/',
-        '/api/v1/forbidden/',
-        '/api/v1/auth_session/login/'
-        ]
-
     if auth and auth.require_auth(request.path, excluded_paths):
         if auth.authorization_header(request) is None and auth.session_cookie(
                 request) is None:
             abort(401)
-        if auth.current_user(request) is None:
+        request.current_user = auth.authenticate(request)
+        if request.current_user is None:
             abort(403)
-        request.current_user = auth.current_user(request)
+
+
+@app.after_request
+def auth_timings(response):
+    """ Report the time spent authenticating in a Server-Timing header
+    when AUTH_TIMINGS is set
+    """
+    if AUTH_TIMINGS and 'auth' in g and g.auth.timings:
+        response.headers['Server-Timing'] = g.auth.server_timing()
+    return response
 
 
 @app.errorhandler(404)
@@ -73,6 +87,14 @@ def forbidden(error) -> str:
     return jsonify({"error": "Forbidden"}), 403
 
 
+@app.errorhandler(TimeoutError)
+def unavailable(error) -> str:
+    """ Overload handler: a full hashing pool (see models.hashers.run)
+    """
+    return jsonify({"error": "Service Unavailable"}), 503, \
+        {"Retry-After": "1"}
+
+
 if __name__ == "__main__":
     host = getenv("API_HOST", "0.0.0.0")
     port = getenv("API_PORT", "5000")
@@ -2,31 +2,89 @@
 """ 3. Auth class
 """
 
-from flask import request
+from api.v1.auth.path_matcher import PathMatcher, compile_paths
+from flask import g, has_app_context, request
 from os import getenv
-from typing import List, TypeVar
+from typing import Dict, List, TypeVar, Union
+import time
+
+
+class AuthContext:
+    """ Authentication state of one request (flask.g.auth): the user,
+    resolved once, and the seconds spent in each stage resolving it
+    """
+
+    def __init__(self):
+        """ Initialize an unresolved context
+        """
+        self.resolved = False
+        self.user = None
+        self.timings: Dict[str, float] = {}
+
+    def stage(self, name: str) -> 'Stage':
+        """ Context manager adding the time spent in its block to
+        timings[name]
+        """
+        return Stage(self.timings, name)
+
+    def server_timing(self) -> str:
+        """ timings as a Server-Timing header value (milliseconds)
+        """
+        return ", ".join(f"{name};dur={seconds * 1000:.3f}"
+                         for name, seconds in self.timings.items())
+
+
+class Stage:
+    """ Timer of one stage of an AuthContext
+    """
+    __slots__ = ('timings', 'name', 'start')
+
+    def __init__(self, timings: Dict[str, float], name: str):
+        """ Initialize the timer of timings[name]
+        """
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        """ Start timing
+        """
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        """ Add the elapsed time
+        """
+        self.timings[self.name] = self.timings.get(self.name, 0.0) + \
+            time.perf_counter() - self.start
+
+
+def auth_context() -> AuthContext:
+    """ AuthContext of the current request (a throwaway one outside of
+    a Flask app context)
+    """
+    if not has_app_context():
+        return AuthContext()
+    context = g.get('auth')
+    if context is None:
+        context = g.auth = AuthContext()
+    return context
 
 
 class Auth:
     """ Auth class.
     """
 
-    def require_auth(self, path: str, excluded_paths: List[str]) -> bool:
+    def require_auth(self, path: str,
+                     excluded_paths: Union[List[str], PathMatcher]) -> bool:
         """ require_auth method
+        excluded_paths: list of paths ("*" at the end matches any
+        suffix), or a PathMatcher compiled from one
         """
         if path is None or not excluded_paths:
             return True
+        if not isinstance(excluded_paths, PathMatcher):
+            excluded_paths = compile_paths(tuple(excluded_paths))
         path = path + '/' if path[-1] != '/' else path
-        has_wildcard = any(x.endswith("*") for x in excluded_paths)
-        if not has_wildcard:
-            return path not in excluded_paths
-        for entry in excluded_paths:
-            if entry.endswith("*"):
-                if path.startswith(entry[:-1]):
-                    return False
-            if path == entry:
-                return False
-        return True
+        return not excluded_paths.match(path)
 
     def authorization_header(self, request=None) -> str:
         """ authorization_header method
@@ -42,6 +100,16 @@ class Auth:
         """
         return None
 
+    def authenticate(self, request=None) -> TypeVar('User'):
+        """ current_user(request), resolved once per request: every later
+        call returns the user kept in the request AuthContext
+        """
+        context = auth_context()
+        if not context.resolved:
+            context.user = self.current_user(request)
+            context.resolved = True
+        return context.user
+
     def session_cookie(self, request=None):
         """ session_cookie method
         """
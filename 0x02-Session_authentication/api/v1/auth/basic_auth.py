@@ -3,14 +3,34 @@
 """
 
 import base64
-from api.v1.auth.auth import Auth
+import hashlib
+import secrets
+from api.v1.auth.auth import Auth, auth_context
+from api.v1.auth.session_store import SessionStore
 from models.user import User
+from os import getenv
 from typing import TypeVar, Tuple, Optional
 
 class BasicAuth(Auth):
     """BasicAuth class for Basic Authentication.
+
+    Verified credentials are cached: a keyed digest of the Authorization
+    header maps to the user it resolved to, for BASIC_AUTH_CACHE_TTL
+    seconds (0 disables the cache), BASIC_AUTH_CACHE_SIZE headers at
+    most. A cached user whose email or password has changed since, or
+    who was removed, is looked up and verified again.
     """
 
+    def __init__(self):
+        """Initialize the verified-credential cache.
+        """
+        self.credentials = SessionStore(
+            int(getenv("BASIC_AUTH_CACHE_SIZE", 10000)))
+        self.credentials_ttl = float(getenv("BASIC_AUTH_CACHE_TTL", 60))
+        self.credentials_key = secrets.token_bytes(32)
+        self.hits = 0
+        self.misses = 0
+
     def extract_base64_authorization_header(self,
                                             authorization_header: str) -> Optional[str]:
         """Extract base64 part from the Authorization header.
@@ -67,13 +87,23 @@ class BasicAuth(Auth):
 
         Returns:
             Optional[TypeVar('User')]: User object if valid, otherwise None.
+
+        Raises:
+            TimeoutError: The password hashing pool is full.
         """
         if isinstance(user_email, str) and isinstance(user_pwd, str):
+            context = auth_context()
             try:
-                users = User.search({"email": user_email})
+                with context.stage("lookup"):
+                    users = User.search({"email": user_email})
                 for user in users:
-                    if user.is_valid_password(user_pwd):
+                    with context.stage("verify"):
+                        valid = user.is_valid_password(user_pwd)
+                    if valid:
                         return user
+            except TimeoutError:
+                # hashing pool full: the app answers 503
+                raise
             except Exception:
                 return None
         return None
@@ -87,8 +117,53 @@ class BasicAuth(Auth):
         Returns:
             Optional[TypeVar('User')]: Current user object or None if not found.
         """
+        context = auth_context()
         header = self.authorization_header(request)
-        b64header = self.extract_base64_authorization_header(header)
-        decoded = self.decode_base64_authorization_header(b64header)
-        user_creds = self.extract_user_credentials(decoded)
-        return self.user_object_from_credentials(*user_creds)
+        key = None
+        if header and self.credentials_ttl:
+            with context.stage("cache"):
+                key = hashlib.blake2b(header.encode(), digest_size=16,
+                                      key=self.credentials_key).digest()
+                user = self.cached_user(key)
+            if user is not None:
+                return user
+        with context.stage("header"):
+            b64header = self.extract_base64_authorization_header(header)
+            decoded = self.decode_base64_authorization_header(b64header)
+            user_creds = self.extract_user_credentials(decoded)
+        user = self.user_object_from_credentials(*user_creds)
+        if user is not None and key is not None:
+            self.credentials.set(key, (user.id, user.email, user.password),
+                                 self.credentials_ttl)
+        return user
+
+    def cached_user(self, key: bytes) -> Optional[TypeVar('User')]:
+        """Get the user cached under a header digest.
+
+        Args:
+            key (bytes): Digest of the Authorization header.
+
+        Returns:
+            Optional[TypeVar('User')]: The user, or None if nothing is
+            cached or the user was removed or changed email or password.
+        """
+        cached = self.credentials.get(key)
+        if cached is not None:
+            user_id, email, password = cached
+            user = User.get(user_id)
+            if user is not None and user.email == email \
+                    and user.password == password:
+                self.hits += 1
+                return user
+            self.credentials.pop(key)
+        self.misses += 1
+        return None
+
+    def credential_metrics(self) -> dict:
+        """Get the verified-credential cache metrics.
+
+        Returns:
+            dict: Cache hits and misses, and the cache store metrics.
+        """
+        return {"hits": self.hits, "misses": self.misses,
+                **self.credentials.metrics()}
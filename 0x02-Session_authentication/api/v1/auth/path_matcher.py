@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+""" Excluded paths matcher of Auth.require_auth
+"""
+from functools import lru_cache
+from typing import Iterable, Tuple
+
+END = ""  # marks the end of a wildcard prefix in the trie
+
+
+class PathMatcher:
+    """ Excluded paths compiled once: exact entries in a set, entries
+    ending with "*" in a character trie of their prefixes, so matching a
+    path costs O(len(path)) whatever the number of entries
+    """
+
+    def __init__(self, paths: Iterable[str]):
+        """ Compile paths
+        """
+        self.exact = set()
+        self.prefixes = {}
+        for entry in paths:
+            if not entry.endswith("*"):
+                self.exact.add(entry)
+                continue
+            node = self.prefixes
+            for char in entry[:-1]:
+                node = node.setdefault(char, {})
+            node[END] = True
+
+    def __bool__(self) -> bool:
+        """ False when there is no entry
+        """
+        return bool(self.exact or self.prefixes)
+
+    def match(self, path: str) -> bool:
+        """ Whether path is excluded
+        """
+        if path in self.exact:
+            return True
+        node = self.prefixes
+        for char in path:
+            if END in node:
+                return True
+            node = node.get(char)
+            if node is None:
+                return False
+        return END in node
+
+
+@lru_cache(maxsize=32)
+def compile_paths(paths: Tuple[str, ...]) -> PathMatcher:
+    """ Matcher of paths, compiled once per distinct tuple
+    """
+    return PathMatcher(paths)
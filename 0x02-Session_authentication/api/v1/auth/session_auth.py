@@ -4,7 +4,8 @@
 SessionAuth module
 """
 
-from api.v1.auth.auth import Auth
+from api.v1.auth.auth import Auth, auth_context
+from api.v1.auth.session_store import make_session_store
 from typing import TypeVar
 from uuid import uuid4
 from models.user import User
@@ -14,7 +15,7 @@ class SessionAuth(Auth):
     """
     SessionAuth class.
     """
-    user_id_by_session_id = {}
+    user_id_by_session_id = make_session_store()
 
     def create_session(self, user_id: str = None) -> str:
         """
@@ -41,8 +42,17 @@ class SessionAuth(Auth):
         if request:
             session_cookie = self.session_cookie(request)
             if session_cookie:
-                user_id = self.user_id_for_session_id(session_cookie)
-                return User.get(user_id)
+                context = auth_context()
+                with context.stage("session"):
+                    user_id = self.user_id_for_session_id(session_cookie)
+                with context.stage("lookup"):
+                    return User.get(user_id)
+
+    def session_metrics(self) -> dict:
+        """
+        Metrics of the session store.
+        """
+        return self.user_id_by_session_id.metrics()
 
     def destroy_session(self, request=None) -> bool:
         """
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+""" Session stores shared between processes: SQLite (one host) and
+Redis (any number of hosts)
+"""
+from api.v1.auth.session_store import SessionBackend
+from datetime import datetime
+from typing import Any, BinaryIO, Tuple
+from urllib.parse import urlparse
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+
+def encode(value: Any) -> str:
+    """ JSON of a session value (datetimes included)
+    """
+    return json.dumps(value, default=_encode_datetime)
+
+
+def decode(text: str) -> Any:
+    """ Session value of its JSON
+    """
+    return json.loads(text, object_hook=_decode_datetime)
+
+
+def _encode_datetime(obj: Any) -> dict:
+    """ datetime -> {"$datetime": ISO 8601}
+    """
+    if isinstance(obj, datetime):
+        return {"$datetime": obj.isoformat()}
+    raise TypeError(f"{type(obj).__name__} is not JSON serializable")
+
+
+def _decode_datetime(obj: dict) -> Any:
+    """ {"$datetime": ISO 8601} -> datetime
+    """
+    if len(obj) == 1 and "$datetime" in obj:
+        return datetime.fromisoformat(obj["$datetime"])
+    return obj
+
+
+class SQLiteSessionStore(SessionBackend):
+    """ Sessions in a table of a SQLite database in WAL mode, shared by
+    the worker processes of one host. Expiry is a wall-clock expires_at
+    column checked by every read; each set also deletes a batch of the
+    expired rows (through the expires_at index).
+    """
+
+    def __init__(self, db_path: str, purge_batch: int = 100):
+        """ Initialize a store on the database file db_path
+        """
+        self.db_path = db_path
+        self.purge_batch = purge_batch
+        self.expirations = 0
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        """ Connection of the current thread (reopened after a fork)
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30,
+                                   isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute('CREATE TABLE IF NOT EXISTS "sessions" '
+                         '(id TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                         'expires_at REAL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS "sessions_expires_at" '
+                         'ON "sessions" (expires_at)')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def set(self, key: str, value: Any, ttl: float = None):
+        """ Store value under key, for ttl seconds if given
+        """
+        expires_at = time.time() + ttl if ttl else None
+        self._connection().execute(
+            'INSERT INTO "sessions" VALUES (?, ?, ?) ON CONFLICT (id) '
+            'DO UPDATE SET value = excluded.value, '
+            'expires_at = excluded.expires_at',
+            (key, encode(value), expires_at))
+        self.purge(self.purge_batch)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """ Value of an unexpired session, else default
+        """
+        row = self._connection().execute(
+            'SELECT value FROM "sessions" WHERE id = ? '
+            'AND (expires_at IS NULL OR expires_at > ?)',
+            (key, time.time())).fetchone()
+        return default if row is None else decode(row[0])
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        """ Remove a session and return its value (default if there was
+        none or it had expired)
+        """
+        row = self._connection().execute(
+            'DELETE FROM "sessions" WHERE id = ? RETURNING value, expires_at',
+            (key,)).fetchone()
+        if row is None or row[1] is not None and row[1] <= time.time():
+            return default
+        return decode(row[0])
+
+    def purge(self, limit: int) -> int:
+        """ Delete at most limit expired sessions.
+        Return: number of sessions deleted
+        """
+        deleted = self._connection().execute(
+            'DELETE FROM "sessions" WHERE id IN (SELECT id FROM "sessions" '
+            'WHERE expires_at <= ? LIMIT ?)', (time.time(), limit)).rowcount
+        self.expirations += deleted
+        return deleted
+
+    def metrics(self) -> dict:
+        """ Sessions purged by this process
+        """
+        return {"backend": "sqlite", "expirations": self.expirations}
+
+
+class RedisClient:
+    """ Minimal client of the Redis protocol (RESP2), enough for the
+    session store: one connection per thread and process, commands sent
+    as arrays of bulk strings
+    """
+
+    def __init__(self, url: str, timeout: float = 5):
+        """ Initialize a client of redis://[:password@]host[:port][/db]
+        """
+        parts = urlparse(url)
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or 6379
+        self.db = int(parts.path.lstrip("/") or 0)
+        self.password = parts.password
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self) -> Tuple[socket.socket, BinaryIO]:
+        """ (socket, reader) of the current thread (reopened after a
+        fork), authenticated and on the database of the URL
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            sock = socket.create_connection((self.host, self.port),
+                                            self.timeout)
+            conn = self._local.conn = (sock, sock.makefile('rb'))
+            self._local.pid = os.getpid()
+            if self.password:
+                self.execute("AUTH", self.password)
+            if self.db:
+                self.execute("SELECT", self.db)
+        return conn
+
+    def execute(self, *args: Any) -> Any:
+        """ Send one command and return its reply (RuntimeError if
+        the server answers an error)
+        """
+        sock, reader = self._connection()
+        parts = [str(arg).encode() if not isinstance(arg, bytes) else arg
+                 for arg in args]
+        request = b"*%d\r\n" % len(parts) + b"".join(
+            b"$%d\r\n%s\r\n" % (len(part), part) for part in parts)
+        try:
+            sock.sendall(request)
+            return self._reply(reader)
+        except OSError:
+            # the connection state is unknown: start over next time
+            self._local.conn = None
+            sock.close()
+            raise
+
+    def _reply(self, reader: BinaryIO) -> Any:
+        """ Read one reply
+        """
+        line = reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("redis: connection closed")
+        kind, data = line[:1], line[1:-2]
+        if kind == b"+":
+            return data.decode()
+        if kind == b"-":
+            raise RuntimeError(f"redis: {data.decode()}")
+        if kind == b":":
+            return int(data)
+        if kind == b"$":
+            if int(data) < 0:
+                return None
+            value = reader.read(int(data) + 2)
+            return value[:-2].decode()
+        if kind == b"*":
+            if int(data) < 0:
+                return None
+            return [self._reply(reader) for _ in range(int(data))]
+        raise ConnectionError(f"redis: bad reply {line!r}")
+
+
+class RedisSessionStore(SessionBackend):
+    """ Sessions as Redis keys <prefix><session ID>; ttl is set with the
+    value in the same SET (PX), and Redis expires the keys itself
+    """
+
+    def __init__(self, url: str, prefix: str = "session:"):
+        """ Initialize a store on the Redis server at url
+        """
+        self.client = RedisClient(url)
+        self.prefix = prefix
+
+    def set(self, key: str, value: Any, ttl: float = None):
+        """ Store value under key, for ttl seconds if given
+        """
+        args = ["SET", self.prefix + key, encode(value)]
+        if ttl:
+            args += ["PX", max(1, int(ttl * 1000))]
+        self.client.execute(*args)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """ Value of an unexpired session, else default
+        """
+        value = self.client.execute("GET", self.prefix + key)
+        return default if value is None else decode(value)
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        """ Remove a session and return its value, else default
+        (GETDEL: Redis 6.2 or later)
+        """
+        value = self.client.execute("GETDEL", self.prefix + key)
+        return default if value is None else decode(value)
+
+    def metrics(self) -> dict:
+        """ Server of the store
+        """
+        return {"backend": "redis",
+                "server": f"{self.client.host}:{self.client.port}"}
@@ -5,56 +5,127 @@ SessionDBAuth module
 """
 
 from api.v1.auth.session_exp_auth import SessionExpAuth
+from api.v1.auth.session_store import SessionStore
 from os import getenv
 from models.user_session import UserSession
+from models.write_behind import WriteBehind
 from datetime import datetime, timedelta
+from uuid import uuid4
 
 
 class SessionDBAuth(SessionExpAuth):
     """
     SessionDBAuth class.
+    Sessions are UserSession objects, found through the session_id index
+    behind a read-through cache (SESSION_DB_CACHE_SIZE sessions, each for
+    at most SESSION_DB_CACHE_TTL seconds), and written behind: logins
+    and logouts are queued and flushed in batches every
+    SESSION_DB_FLUSH_INTERVAL seconds. A sliding session expires
+    SESSION_DURATION seconds after its last renewal (its updated_at).
+    A logout takes effect at once: the session is kept as a tombstone,
+    never found, cached or renewed again, until well after its remove
+    is flushed.
     """
 
+    def __init__(self):
+        """
+        Constructor.
+        """
+        super().__init__()
+        self.cache = SessionStore(int(getenv("SESSION_DB_CACHE_SIZE", 100000)))
+        self.cache_ttl = float(getenv("SESSION_DB_CACHE_TTL", 10))
+        self.writes = WriteBehind(
+            UserSession, float(getenv("SESSION_DB_FLUSH_INTERVAL", 0.1)),
+            int(getenv("SESSION_DB_FLUSH_BATCH", 1000)))
+        # IDs of the UserSessions logged out: outlive the flush of their
+        # remove and the requests that found them before the logout
+        self.destroyed = SessionStore(
+            int(getenv("SESSION_DB_CACHE_SIZE", 100000)))
+        self.tombstone_ttl = 60 + self.cache_ttl + self.writes.interval
+
     def create_session(self, user_id=None):
         """
         Creates a session for a user.
         """
-        if user_id:
-            session_id = super().create_session(user_id)
-            if not session_id:
-                return None
-            new_user_session = UserSession(user_id=user_id, session_id=session_id)
-            new_user_session.save()
-            return session_id
+        if not user_id or type(user_id) != str:
+            return None
+        session_id = str(uuid4())
+        user_session = UserSession(user_id=user_id, session_id=session_id)
+        self.writes.save(user_session)
+        self.cache_session(user_session)
+        self.renew(session_id)
+        return session_id
 
     def user_id_for_session_id(self, session_id=None):
         """
         Retrieves the user_id for a given session_id.
         """
-        if not session_id:
-            return None
-        try:
-            user_sessions = UserSession.search({'session_id': session_id})
-            for user_session in user_sessions:
-                created_at = user_session.get('created_at')
-                if not created_at or (datetime.now() > created_at + timedelta(seconds=self.session_duration)):
-                    return None
-                return user_session.get('user_id')
-        except Exception:
+        user_session = self.user_session(session_id)
+        return user_session.user_id if user_session else None
+
+    def user_session(self, session_id=None):
+        """
+        Unexpired UserSession of session_id: from the cache, else from
+        the store (then cached); expired ones found there are removed.
+        A sliding session due for renewal is saved again (written behind).
+        Logged out sessions are skipped.
+        """
+        if not session_id or type(session_id) != str:
             return None
+        user_session = self.cache.get(session_id)
+        if user_session is not None and self.destroyed and \
+                user_session.id in self.destroyed:
+            user_session = None
+        if user_session is None:
+            for found in UserSession.search({'session_id': session_id}):
+                if found.id in self.destroyed:
+                    continue
+                if self.cache_session(found):
+                    user_session = found
+                    break
+                self.writes.remove(found)
+            else:
+                return None
+        if self.renew(session_id) and user_session.id not in self.destroyed:
+            self.writes.save(user_session)
+        return user_session
+
+    def cache_session(self, user_session) -> bool:
+        """
+        Cache user_session until it expires, for cache_ttl seconds at
+        most. Return False, caching nothing, if it has expired.
+        """
+        ttl = self.cache_ttl
+        if self.session_duration > 0:
+            start = user_session.updated_at if self.sliding \
+                else user_session.created_at
+            expires_at = start + timedelta(seconds=self.session_duration)
+            remaining = (expires_at - datetime.utcnow()).total_seconds()
+            if remaining <= 0:
+                return False
+            ttl = min(ttl, remaining)
+        self.cache.set(user_session.session_id, user_session, ttl)
+        return True
 
     def destroy_session(self, request=None) -> bool:
         """
         Destroys the session associated with a request.
         """
-        if request:
-            session_id = self.session_cookie(request)
-            if session_id and super().destroy_session(request):
-                try:
-                    user_sessions = UserSession.search({'session_id': session_id})
-                    for user_session in user_sessions:
-                        user_session.remove()
-                        return True
-                except Exception:
-                    return False
-        return False
+        if not request:
+            return False
+        session_id = self.session_cookie(request)
+        user_session = self.user_session(session_id)
+        if user_session is None:
+            return False
+        self.destroyed.set(user_session.id, True, self.tombstone_ttl)
+        self.cache.pop(session_id)
+        self.writes.remove(user_session)
+        return True
+
+    def session_metrics(self) -> dict:
+        """
+        Metrics of the read-through cache and of the write-behind queue.
+        """
+        return {"stored": UserSession.count(),
+                "cache": self.cache.metrics(),
+                "write_behind": self.writes.metrics()}
@@ -3,11 +3,17 @@
 """
 
 from api.v1.auth.session_auth import SessionAuth
-from datetime import datetime, timedelta
+from api.v1.auth.session_store import SessionStore
+from datetime import datetime
 from os import getenv
 
 class SessionExpAuth(SessionAuth):
     """ SessionExpAuth class.
+    Sessions last SESSION_DURATION seconds (forever if 0): the session
+    store expires them, so lookups do no date arithmetic. With
+    SESSION_SLIDING set, a session in use is renewed for another
+    SESSION_DURATION seconds, at most once per SESSION_TOUCH_INTERVAL
+    seconds (a tenth of the duration by default) in each process.
     """
 
     def __init__(self):
@@ -15,6 +21,13 @@ class SessionExpAuth(SessionAuth):
         """
         duration = getenv('SESSION_DURATION')
         self.session_duration = int(duration) if duration and duration.isdigit() else 0
+        self.sliding = bool(getenv('SESSION_SLIDING')) and \
+            self.session_duration > 0
+        touch = getenv('SESSION_TOUCH_INTERVAL')
+        self.touch_interval = float(touch) if touch else \
+            max(1, self.session_duration / 10)
+        # sessions renewed by this process less than touch_interval ago
+        self.renewed = SessionStore(int(getenv("SESSION_MAX_SIZE", 100000)))
 
     def create_session(self, user_id=None):
         """ Creates a session.
@@ -22,7 +35,9 @@ class SessionExpAuth(SessionAuth):
         session_id = super().create_session(user_id) if user_id else None
         if session_id:
             session_dict = {'user_id': user_id, 'created_at': datetime.now()}
-            self.user_id_by_session_id[session_id] = session_dict
+            self.user_id_by_session_id.set(session_id, session_dict,
+                                           self.session_duration or None)
+            self.renew(session_id)
         return session_id
 
     def user_id_for_session_id(self, session_id=None):
@@ -30,9 +45,18 @@ class SessionExpAuth(SessionAuth):
         """
         if session_id:
             session_dict = self.user_id_by_session_id.get(session_id)
-            if session_dict:
-                user_id = session_dict['user_id']
-                session_start = session_dict['created_at']
-                if self.session_duration <= 0 or datetime.now() <= session_start + timedelta(seconds=self.session_duration):
-                    return user_id
+            if session_dict and 'created_at' in session_dict:
+                if self.renew(session_id):
+                    self.user_id_by_session_id.set(
+                        session_id, session_dict, self.session_duration)
+                return session_dict['user_id']
         return None
+
+    def renew(self, session_id: str) -> bool:
+        """ Whether a sliding session is due for renewal: True at most
+        once per touch_interval for each session
+        """
+        if not self.sliding or session_id in self.renewed:
+            return False
+        self.renewed.set(session_id, True, self.touch_interval)
+        return True
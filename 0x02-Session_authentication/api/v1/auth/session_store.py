@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+""" Session stores of SessionAuth
+"""
+from collections import OrderedDict
+from os import getenv
+from typing import Any, Optional
+import heapq
+import os
+import threading
+import time
+
+
+class SessionBackend:
+    """ Interface of the session stores: set(key, value, ttl), get, pop
+    and metrics; the mapping methods SessionAuth uses are derived here
+    """
+
+    def set(self, key: str, value: Any, ttl: float = None):
+        """ Store value under key, for ttl seconds if given
+        """
+        raise NotImplementedError
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """ Value of an unexpired session, else default
+        """
+        raise NotImplementedError
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        """ Remove a session and return its value, else default
+        """
+        raise NotImplementedError
+
+    def metrics(self) -> dict:
+        """ Store metrics for GET /api/v1/stats
+        """
+        return {}
+
+    def __setitem__(self, key: str, value: Any):
+        """ set() without ttl
+        """
+        self.set(key, value)
+
+    def __contains__(self, key: str) -> bool:
+        """ Whether key is an unexpired session
+        """
+        return self.get(key, self) is not self
+
+
+class SessionStore(SessionBackend):
+    """ In-memory sessions of one process: session ID -> value, holding
+    at most max_size sessions, the least recently used one evicted
+    first. Sessions set with a ttl expire; a heap of their deadlines
+    lets a background sweeper purge them in deadline order, sweep_batch
+    at a time.
+    Deadlines are integer time.monotonic_ns() values: clock changes
+    don't move them and checking one is an integer comparison.
+    """
+
+    def __init__(self, max_size: Optional[int] = 100000,
+                 sweep_interval: float = 30, sweep_batch: int = 1000):
+        """ Initialize an empty store, unbounded if max_size is None;
+        no sweeper if sweep_interval is 0
+        """
+        self.max_size = max_size
+        self.sweep_interval = sweep_interval
+        self.sweep_batch = sweep_batch
+        self.evictions = 0
+        self.expirations = 0
+        self._data = OrderedDict()  # key -> (value, deadline or None)
+        self._deadlines = []  # heap of (deadline, key), may hold stale
+        self._lock = threading.Lock()
+        self._sweeper_pid = None
+
+    def set(self, key: str, value: Any, ttl: float = None):
+        """ Store value under key, for ttl seconds if given
+        """
+        deadline = time.monotonic_ns() + int(ttl * 1e9) if ttl else None
+        with self._lock:
+            self._data[key] = (value, deadline)
+            self._data.move_to_end(key)
+            if deadline is not None:
+                heapq.heappush(self._deadlines, (deadline, key))
+                if len(self._deadlines) > 2 * len(self._data) + 64:
+                    # too many stale deadlines (replaced, removed or
+                    # evicted sessions): rebuild from the live ones
+                    self._deadlines = [(d, k) for k, (v, d)
+                                       in self._data.items() if d]
+                    heapq.heapify(self._deadlines)
+            while self.max_size is not None and \
+                    len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+        self._start_sweeper()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """ Value of an unexpired session (now the most recently used),
+        else default
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            if entry[1] is not None and entry[1] <= time.monotonic_ns():
+                del self._data[key]
+                self.expirations += 1
+                return default
+            self._data.move_to_end(key)
+            return entry[0]
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        """ Remove a session and return its value (default if there was
+        none or it had expired)
+        """
+        with self._lock:
+            entry = self._data.pop(key, None)
+        if entry is None or \
+                entry[1] is not None and entry[1] <= time.monotonic_ns():
+            return default
+        return entry[0]
+
+    def __len__(self) -> int:
+        """ Number of stored sessions (expired ones not yet swept
+        included)
+        """
+        return len(self._data)
+
+    def sweep(self, limit: int = None) -> int:
+        """ Remove expired sessions, earliest deadline first, looking at
+        no more than limit deadlines.
+        Return: number of sessions removed
+        """
+        now = time.monotonic_ns()
+        removed = 0
+        with self._lock:
+            deadlines = self._deadlines
+            while deadlines and deadlines[0][0] <= now and \
+                    (limit is None or limit > 0):
+                deadline, key = heapq.heappop(deadlines)
+                if limit is not None:
+                    limit -= 1
+                entry = self._data.get(key)
+                if entry is not None and entry[1] == deadline:
+                    del self._data[key]
+                    self.expirations += 1
+                    removed += 1
+        return removed
+
+    def metrics(self) -> dict:
+        """ Live sessions, evictions and expirations so far
+        """
+        return {"backend": "memory", "live": len(self._data),
+                "max_size": self.max_size,
+                "evictions": self.evictions,
+                "expirations": self.expirations}
+
+    def _start_sweeper(self):
+        """ Start the sweeper thread of this process if not running
+        """
+        if not self.sweep_interval or self._sweeper_pid == os.getpid():
+            return
+        with self._lock:
+            if self._sweeper_pid == os.getpid():
+                return
+            self._sweeper_pid = os.getpid()
+        threading.Thread(target=self._sweep_forever, daemon=True,
+                         name="session-sweeper").start()
+
+    def _sweep_forever(self):
+        """ Every sweep_interval seconds, purge the expired sessions one
+        batch at a time, releasing the lock between batches
+        """
+        while True:
+            time.sleep(self.sweep_interval)
+            while self._deadlines and \
+                    self._deadlines[0][0] <= time.monotonic_ns():
+                self.sweep(self.sweep_batch)
+
+
+def make_session_store() -> SessionBackend:
+    """ Session store selected by SESSION_BACKEND:
+      - memory (default): SessionStore of this process, configured by
+        SESSION_MAX_SIZE (100000), SESSION_SWEEP_INTERVAL (30 seconds)
+        and SESSION_SWEEP_BATCH (1000)
+      - sqlite: SQLiteSessionStore on SESSION_SQLITE_PATH
+        (.db_sessions.sqlite3), shared by the processes of this host
+      - redis: RedisSessionStore on SESSION_REDIS_URL
+        (redis://localhost:6379/0), shared by every host
+    """
+    backend = getenv("SESSION_BACKEND", "memory")
+    if backend == "sqlite":
+        from api.v1.auth.session_backends import SQLiteSessionStore
+        return SQLiteSessionStore(
+            getenv("SESSION_SQLITE_PATH", ".db_sessions.sqlite3"))
+    if backend == "redis":
+        from api.v1.auth.session_backends import RedisSessionStore
+        return RedisSessionStore(
+            getenv("SESSION_REDIS_URL", "redis://localhost:6379/0"))
+    if backend != "memory":
+        raise ValueError(f"unknown SESSION_BACKEND: {backend}")
+    return SessionStore(int(getenv("SESSION_MAX_SIZE", 100000)),
+                        float(getenv("SESSION_SWEEP_INTERVAL", 30)),
+                        int(getenv("SESSION_SWEEP_BATCH", 1000)))
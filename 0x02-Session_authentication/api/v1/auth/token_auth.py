@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+""" TokenAuth module
+"""
+from api.v1.auth.auth import auth_context
+from api.v1.auth.session_auth import SessionAuth
+from api.v1.auth.session_store import SessionStore
+from models.user import User
+from os import getenv
+from typing import Optional, Tuple, TypeVar
+import base64
+import hmac
+import secrets
+import time
+
+
+class TokenAuth(SessionAuth):
+    """ TokenAuth class.
+    Sessions are signed tokens, "<user ID>.<expiry>.<token ID>.<HMAC>",
+    sent in the session cookie or as "Authorization: Bearer <token>":
+    checking one is an HMAC-SHA256 over the token and a constant-time
+    comparison, with no store behind it. Users are read through a cache
+    (AUTH_USER_CACHE_SIZE users for AUTH_USER_CACHE_TTL seconds), whose
+    entries only hold while User.version() is unchanged, so a removed
+    or changed user is read again at once.
+    Logging out denies the token ID until the token expires; the
+    denylist lives in the memory of each worker.
+    """
+
+    def __init__(self):
+        """ Constructor: tokens are signed with AUTH_TOKEN_SECRET and
+        last SESSION_DURATION seconds (3600 by default)
+        """
+        secret = getenv("AUTH_TOKEN_SECRET")
+        if not secret:
+            raise ValueError("AUTH_TOKEN_SECRET is not set")
+        self.secret = secret.encode()
+        duration = getenv("SESSION_DURATION")
+        self.session_duration = int(duration) \
+            if duration and duration.isdigit() and int(duration) else 3600
+        self.users = SessionStore(
+            int(getenv("AUTH_USER_CACHE_SIZE", 10000)))
+        self.users_ttl = float(getenv("AUTH_USER_CACHE_TTL", 10))
+        self.denylist = SessionStore(None)
+
+    def sign(self, body: str) -> str:
+        """ HMAC-SHA256 of body, base64url without padding
+        """
+        digest = hmac.digest(self.secret, body.encode(), "sha256")
+        return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+    def create_session(self, user_id: str = None) -> str:
+        """ Signed token of user_id
+        """
+        if not user_id or type(user_id) != str:
+            return None
+        body = "{}.{}.{}".format(user_id,
+                                 int(time.time()) + self.session_duration,
+                                 secrets.token_hex(8))
+        return "{}.{}".format(body, self.sign(body))
+
+    def verify(self, token: str) -> Optional[Tuple[str, int, str]]:
+        """ (user ID, expiry, token ID) of a valid, unexpired and not
+        denied token, else None
+        """
+        if not token or type(token) != str or not token.isascii():
+            # compare_digest raises on non-ASCII strings
+            return None
+        body, _, signature = token.rpartition(".")
+        if not hmac.compare_digest(self.sign(body), signature):
+            return None
+        try:
+            user_id, expires, token_id = body.rsplit(".", 2)
+            expires = int(expires)
+        except ValueError:
+            return None
+        if expires <= time.time():
+            return None
+        if self.denylist and token_id in self.denylist:
+            return None
+        return user_id, expires, token_id
+
+    def user_id_for_session_id(self, session_id: str = None) -> str:
+        """ User ID of a valid token
+        """
+        claims = self.verify(session_id)
+        return claims[0] if claims else None
+
+    def token(self, request=None) -> Optional[str]:
+        """ Token of a request: session cookie, else Bearer header
+        """
+        token = self.session_cookie(request)
+        if token:
+            return token
+        header = self.authorization_header(request)
+        if header and header.startswith("Bearer "):
+            return header[7:]
+        return None
+
+    def current_user(self, request=None) -> TypeVar('User'):
+        """ User of the token of the request
+        """
+        if not request:
+            return None
+        context = auth_context()
+        with context.stage("verify"):
+            user_id = self.user_id_for_session_id(self.token(request))
+        if user_id is None:
+            return None
+        with context.stage("lookup"):
+            version = User.version()
+            cached = self.users.get(user_id)
+            if cached is not None and cached[1] == version:
+                return cached[0]
+            user = User.get(user_id)
+            if user is None:
+                self.users.pop(user_id)
+            else:
+                self.users.set(user_id, (user, version), self.users_ttl)
+        return user
+
+    def destroy_session(self, request=None) -> bool:
+        """ Deny the token of the request until it expires
+        """
+        if not request:
+            return False
+        claims = self.verify(self.token(request))
+        if claims is None:
+            return False
+        user_id, expires, token_id = claims
+        self.denylist.set(token_id, True, expires - time.time())
+        return True
+
+    def session_metrics(self) -> dict:
+        """ Metrics of the user cache and of the denylist
+        """
+        return {"users": self.users.metrics(),
+                "denylist": self.denylist.metrics()}
@@ -19,10 +19,22 @@ def stats() -> str:
     """ GET /api/v1/stats
     Return:
       - the number of each objects
+      - models: store metrics of every model class (see Base.stats)
+      - sessions: session store metrics, with a session auth
+      - credentials: verified-credential cache metrics, with basic auth
     """
+    from api.v1.app import auth
+    from models.base import MODELS
     from models.user import User
+    from models.user_session import UserSession
     stats = {}
     stats['users'] = User.count()
+    stats['models'] = {name: model.stats()
+                       for name, model in MODELS.items()}
+    if hasattr(auth, 'session_metrics'):
+        stats['sessions'] = auth.session_metrics()
+    if hasattr(auth, 'credential_metrics'):
+        stats['credentials'] = auth.credential_metrics()
     return jsonify(stats)
 
 
@@ -3,18 +3,108 @@
 Module of Users' views
 """
 from api.v1.views import app_views
-from flask import abort, jsonify, request
+from flask import Response, abort, jsonify, make_response, request
 from models.user import User
+from typing import Callable, Iterator, List, Optional
+from urllib.parse import urlencode
+import json
+import zlib
+
+
+MAX_PAGE_SIZE = 1000
 
 
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """ GET /api/v1/users
+    Query parameters (optional):
+      - limit, after: keyset pagination in ID order; when the page is
+        full, the Link header points to the next one
+      - stream=ndjson: one JSON user per line, streamed
+      - stream=json: the JSON list, streamed
+      - fields: comma-separated attributes to return (e.g. id,email)
     Return:
-      - list of all User objects JSON represented
+      - list of all User objects JSON represented, with an ETag that
+        changes whenever a user is saved or removed
+      - 304 if If-None-Match has that ETag
+      - 400 if limit isn't an integer between 1 and MAX_PAGE_SIZE
+    """
+    return conditional(User.version(), list_users)
+
+
+def list_users() -> Response:
+    """ Body of GET /api/v1/users
+    """
+    fields = requested_fields()
+    stream = request.args.get('stream')
+    if stream in ('ndjson', 'json'):
+        return Response(stream_users(stream == 'json', fields),
+                        mimetype='application/x-ndjson' if stream == 'ndjson'
+                        else 'application/json')
+    if 'limit' not in request.args and 'after' not in request.args:
+        all_users = [user.to_json(fields=fields) for user in User.all()]
+        return jsonify(all_users)
+    limit = request.args.get('limit', '100')
+    if not limit.isdigit() or not 0 < int(limit) <= MAX_PAGE_SIZE:
+        return jsonify({'error': "limit must be between 1 and {}"
+                        .format(MAX_PAGE_SIZE)}), 400
+    users = User.page(request.args.get('after'), int(limit))
+    response = jsonify([user.to_json(fields=fields) for user in users])
+    if len(users) == int(limit):
+        response.headers['Link'] = '<{}?{}>; rel="next"'.format(
+            request.base_url, urlencode({**request.args.to_dict(),
+                                         'limit': limit,
+                                         'after': users[-1].id}))
+    return response
+
+
+def user_etag(user: User) -> str:
+    """ ETag of a user: its id, updated_at and revision (updated_at is
+    only stored to the second), read without serializing the user
+    """
+    return "{}-{}-{}".format(user.id,
+                             user.updated_at.strftime("%Y%m%dT%H%M%S"),
+                             user.revision)
+
+
+def conditional(etag: str, build: Callable[[], Response]) -> Response:
+    """ Answer If-None-Match: 304 when it has etag, else the response
+    build() makes. Either way the response carries etag, which covers the
+    query string too (fields, paging) so representations don't share it.
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    if request.query_string:
+        etag = "{}-{:08x}".format(etag, zlib.crc32(request.query_string))
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = make_response(build())
+    response.set_etag(etag)
+    return response
+
+
+def requested_fields() -> Optional[List[str]]:
+    """ Attributes listed in the fields query parameter, or None
+    """
+    fields = request.args.get('fields')
+    if fields is None:
+        return None
+    return [field.strip() for field in fields.split(',') if field.strip()]
+
+
+def stream_users(as_list: bool,
+                 fields: List[str] = None) -> Iterator[str]:
+    """ Serialize the users one at a time, as NDJSON lines or as the
+    chunks of a JSON list
+    """
+    if not as_list:
+        for user in User.iterate():
+            yield json.dumps(user.to_json(fields=fields)) + "\n"
+        return
+    separator = "["
+    for user in User.iterate():
+        yield separator + json.dumps(user.to_json(fields=fields))
+        separator = ","
+    yield "[]" if separator == "[" else "]"
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
@@ -22,21 +112,25 @@ def view_one_user(user_id: str = None) -> str:
     """ GET /api/v1/users/:id
     Path parameter:
       - User ID
+    Query parameter (optional):
+      - fields: comma-separated attributes to return (e.g. id,email)
     Return:
-      - User object JSON represented
+      - User object JSON represented, with its ETag
+      - 304 if If-None-Match has that ETag
       - 404 if the User ID doesn't exist
     """
     if user_id == "me":
         if not request.current_user:
             abort(404)
-        else:
-            return jsonify(request.current_user.to_json())
-    if user_id is None:
+        user = request.current_user
+    elif user_id is None:
         abort(404)
-    user = User.get(user_id)
+    else:
+        user = User.get(user_id)
     if user is None:
         abort(404)
-    return jsonify(user.to_json())
+    return conditional(user_etag(user), lambda: jsonify(
+        user.to_json(fields=requested_fields())))
 
 
 @app_views.route('/users/<user_id>', methods=['DELETE'], strict_slashes=False)
@@ -68,6 +162,7 @@ def create_user() -> str:
     Return:
       - User object JSON represented
       - 400 if can't create the new User
+      - 503 if the password hashing pool is full
     """
     rj = None
     error_msg = None
@@ -90,6 +185,9 @@ def create_user() -> str:
             user.last_name = rj.get("last_name")
             user.save()
             return jsonify(user.to_json()), 201
+        except TimeoutError:
+            # hashing pool full: the app answers 503
+            raise
         except Exception as e:
             error_msg = "Can't create User: {}".format(e)
     return jsonify({'error': error_msg}), 400
@@ -103,16 +201,21 @@ def update_user(user_id: str = None) -> str:
     JSON body:
       - last_name (optional)
       - first_name (optional)
+    Header (optional):
+      - If-Match: ETag of GET /api/v1/users/:id (without query string)
     Return:
-      - User object JSON represented
+      - User object JSON represented, with its new ETag
       - 404 if the User ID doesn't exist
       - 400 if can't update the User
+      - 412 if If-Match doesn't have the current ETag of the User
     """
     if user_id is None:
         abort(404)
     user = User.get(user_id)
     if user is None:
         abort(404)
+    if request.if_match and not request.if_match.contains(user_etag(user)):
+        return jsonify({'error': "Precondition Failed"}), 412
     rj = None
     try:
         rj = request.get_json()
@@ -125,4 +228,6 @@ def update_user(user_id: str = None) -> str:
     if rj.get('last_name') is not None:
         user.last_name = rj.get('last_name')
     user.save()
-    return jsonify(user.to_json()), 200
+    response = jsonify(user.to_json())
+    response.set_etag(user_etag(user))
+    return response, 200
@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+""" Benchmarks of the models store and the API hot paths
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, List
+
+from models.base import DATA
+from models.user import User
+
+SIZES = (1000, 10000, 100000, 1000000)
+
+
+def populate(n: int) -> List[User]:
+    """ Fill the in-memory User store with n users (no file is written)
+    """
+    DATA['User'] = {}
+    User._reset_indexes()
+    users = []
+    for i in range(n):
+        user = User(email=f"user{i}@example.com")
+        DATA['User'][user.id] = user
+        User._index(user)
+        users.append(user)
+    return users
+
+
+def per_call(func: Callable, calls: int) -> float:
+    """ Mean seconds per call of func
+    """
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - start) / calls
+
+
+def bench_search() -> None:
+    """ User.search by email: hash index vs linear scan
+    """
+    print(f"{'users':>8} {'index us':>10} {'scan us':>12}")
+    for n in SIZES:
+        populate(n)
+        email = f"user{n // 2}@example.com"
+        indexed = per_call(lambda: User.search({"email": email}), 1000)
+        scan = per_call(lambda: [u for u in DATA['User'].values()
+                                 if u.email == email],
+                        max(3, 100000 // n))
+        print(f"{n:>8} {indexed * 1e6:>10.2f} {scan * 1e6:>12.1f}")
+
+
+def bench_page() -> None:
+    """ User.page of 100 users from the middle of the ID order, and a
+    walk of every page, with the sorted IDs vs a scan of every ID
+    """
+    import heapq
+    print(f"{'users':>8} {'page us':>9} {'scan page us':>13} {'walk s':>8}")
+    for n in SIZES:
+        users = populate(n)
+        objs = DATA['User']
+        after = sorted(user.id for user in users)[n // 2]
+        paged = per_call(lambda: User.page(after, 100), 1000)
+        scan = per_call(lambda: [objs[obj_id] for obj_id in heapq.nsmallest(
+            100, (obj_id for obj_id in objs if obj_id > after))], 3)
+        start = time.perf_counter()
+        assert sum(1 for _ in User.iterate(100)) == n
+        walk = time.perf_counter() - start
+        print(f"{n:>8} {paged * 1e6:>9.1f} {scan * 1e6:>13.0f} {walk:>8.2f}")
+    DATA['User'] = {}
+
+
+def write_user_file(n: int):
+    """ Write a .db_User.json of n users in the current directory
+    """
+    stamp = "2024-09-04T06:00:00"
+    with open(".db_User.json", "w") as f:
+        json.dump({f"id-{i}": {"id": f"id-{i}", "created_at": stamp,
+                               "updated_at": stamp,
+                               "email": f"user{i}@example.com",
+                               "_password": "0" * 64, "first_name": "Bob",
+                               "last_name": "Dylan"}
+                   for i in range(n)}, f)
+
+
+def bench_load() -> None:
+    """ User.load_from_file: load time, memory per stored user (traced)
+    and size of one User instance (object + __dict__ if any)
+    """
+    print(f"{'users':>8} {'load s':>8} {'bytes/user':>11} {'instance':>9}")
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            for n in SIZES:
+                write_user_file(n)
+                DATA['User'] = {}
+                start = time.perf_counter()
+                User.load_from_file()
+                elapsed = time.perf_counter() - start
+                per_user = ""
+                if n <= 100000:
+                    DATA['User'] = {}
+                    tracemalloc.start()
+                    User.load_from_file()
+                    per_user = tracemalloc.get_traced_memory()[0] // n
+                    tracemalloc.stop()
+                user = next(iter(DATA['User'].values()))
+                instance = sys.getsizeof(user)
+                if hasattr(user, '__dict__'):
+                    instance += sys.getsizeof(user.__dict__)
+                print(f"{n:>8} {elapsed:>8.2f} {per_user:>11} "
+                      f"{instance:>9}")
+        finally:
+            DATA['User'] = {}
+            os.chdir(cwd)
+
+
+def bench_cold_start() -> None:
+    """ User.load_from_file at worker start: JSON vs binary snapshot
+    """
+    print(f"{'users':>8} {'json s':>8} {'binary s':>9} "
+          f"{'json MB':>8} {'binary MB':>10}")
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            for n in SIZES:
+                write_user_file(n)
+                os.environ.pop("BASE_SNAPSHOT", None)
+                start = time.perf_counter()
+                User.load_from_file()
+                json_s = time.perf_counter() - start
+                os.environ["BASE_SNAPSHOT"] = "binary"
+                User.save_to_file()
+                start = time.perf_counter()
+                User.load_from_file()
+                binary_s = time.perf_counter() - start
+                assert User.count() == n
+                print(f"{n:>8} {json_s:>8.2f} {binary_s:>9.2f} "
+                      f"{os.path.getsize('.db_User.json') / 1e6:>8.1f} "
+                      f"{os.path.getsize('.db_User.bin') / 1e6:>10.1f}")
+        finally:
+            os.environ.pop("BASE_SNAPSHOT", None)
+            DATA['User'] = {}
+            os.chdir(cwd)
+
+
+def bench_serialize() -> None:
+    """ Serializing the user list (GET /api/v1/users): first pass (cache
+    filled), repeated pass (cached) and projected to id,email, in users/s
+    """
+    print(f"{'users':>8} {'cold /s':>10} {'warm /s':>10} {'fields /s':>10}")
+    for n in SIZES[:3]:
+        users = populate(n)
+        rates = []
+        for fields in (None, None, ["id", "email"]):
+            start = time.perf_counter()
+            json.dumps([user.to_json(fields=fields) for user in users])
+            rates.append(n / (time.perf_counter() - start))
+        print(f"{n:>8} {rates[0]:>10.0f} {rates[1]:>10.0f} "
+              f"{rates[2]:>10.0f}")
+    DATA['User'] = {}
+
+
+def legacy_require_auth(path: str, excluded_paths: List[str]) -> bool:
+    """ Auth.require_auth as it was before the compiled matcher
+    """
+    if path is None or not excluded_paths:
+        return True
+    path = path + '/' if path[-1] != '/' else path
+    has_wildcard = any(x.endswith("*") for x in excluded_paths)
+    if not has_wildcard:
+        return path not in excluded_paths
+    for entry in excluded_paths:
+        if entry.endswith("*"):
+            if path.startswith(entry[:-1]):
+                return False
+        if path == entry:
+            return False
+    return True
+
+
+def bench_excluded_paths() -> None:
+    """ Auth.require_auth on a required path: list scan vs compiled
+    matcher, by number of rules (half of them wildcards)
+    """
+    from api.v1.auth.auth import Auth
+    from api.v1.auth.path_matcher import PathMatcher
+    auth = Auth()
+    path = "/api/v1/users/2c5c7a9e-8d1f-4b1e-9f0a-1b2c3d4e5f60"
+    print(f"{'rules':>6} {'list us':>9} {'matcher us':>11} {'speedup':>8}")
+    for n in (4, 100, 500):
+        rules = [f"/api/v1/public{i}/" if i % 2 else f"/api/v1/static{i}*"
+                 for i in range(n)]
+        matcher = PathMatcher(rules)
+        old = per_call(lambda: legacy_require_auth(path, rules), 10000)
+        new = per_call(lambda: auth.require_auth(path, matcher), 10000)
+        print(f"{n:>6} {old * 1e6:>9.2f} {new * 1e6:>11.2f} "
+              f"{old / new:>7.1f}x")
+
+
+def bench_session_db() -> None:
+    """ SessionDBAuth with 100k stored sessions (JSON file store):
+    login rate, then authenticated GET /api/v1/users/me per second with
+    the session cache cold and warm
+    """
+    import random
+    from api.v1 import app as api
+    from api.v1.auth.session_db_auth import SessionDBAuth
+    from models.user_session import UserSession
+    os.environ.setdefault("SESSION_NAME", "_my_session_id")
+    n, requests = 100000, 2000
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            user = populate(1)[0]
+            DATA['UserSession'] = {}
+            UserSession._reset_indexes()
+            sessions = [UserSession(user_id=user.id, session_id=f"s{i}")
+                        for i in range(n)]
+            UserSession.save_batch(sessions)
+            api.auth = auth = SessionDBAuth()
+            start = time.perf_counter()
+            for _ in range(1000):
+                auth.create_session(user.id)
+            login = 1000 / (time.perf_counter() - start)
+            start = time.perf_counter()
+            auth.writes.flush()
+            flush = time.perf_counter() - start
+            sync = per_call(lambda: UserSession(
+                user_id=user.id, session_id="sync").save(), 3)
+            picks = [f"s{random.randrange(n)}" for _ in range(requests)]
+            lookups = []
+            for _ in ("cold", "warm"):
+                start = time.perf_counter()
+                for session_id in picks:
+                    auth.user_id_for_session_id(session_id)
+                lookups.append((time.perf_counter() - start) / requests)
+            auth.cache = type(auth.cache)()
+            client = api.app.test_client()
+            rates = []
+            for _ in ("cold", "warm"):
+                start = time.perf_counter()
+                for session_id in picks:
+                    client.set_cookie(os.environ["SESSION_NAME"], session_id)
+                    assert client.get("/api/v1/users/me").status_code == 200
+                rates.append(requests / (time.perf_counter() - start))
+            print(f"stored sessions: {UserSession.count()}")
+            print(f"login: write-behind {login:.0f}/s (1000 logins "
+                  f"flushed in {flush:.2f}s), synchronous save "
+                  f"{1 / sync:.1f}/s")
+            print(f"session lookup us: cold cache {lookups[0] * 1e6:.1f}, "
+                  f"warm cache {lookups[1] * 1e6:.1f}")
+            print(f"GET /api/v1/users/me req/s: cold cache {rates[0]:.0f}, "
+                  f"warm cache {rates[1]:.0f}")
+        finally:
+            DATA['User'] = {}
+            DATA['UserSession'] = {}
+            os.chdir(cwd)
+
+
+def bench_token_auth() -> None:
+    """ Auth cost per request (current_user on a session cookie, each
+    session used once) with 100k live sessions: session_auth with its
+    memory and SQLite stores, session_db_auth with its cache cold and
+    warm, token_auth
+    """
+    import random
+    from api.v1.app import app
+    from api.v1.auth.session_auth import SessionAuth
+    from api.v1.auth.session_backends import SQLiteSessionStore
+    from api.v1.auth.session_db_auth import SessionDBAuth
+    from api.v1.auth.token_auth import TokenAuth
+    from flask import request
+    from models.user_session import UserSession
+    os.environ.setdefault("SESSION_NAME", "_my_session_id")
+    os.environ.setdefault("AUTH_TOKEN_SECRET", "benchmark")
+    n, calls = 100000, 5000
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            user = populate(1)[0]
+            DATA['UserSession'] = {}
+            UserSession._reset_indexes()
+            UserSession.save_batch(
+                UserSession(user_id=user.id, session_id=f"s{i}")
+                for i in range(n))
+            session_auth = SessionAuth()
+            sqlite_auth = SessionAuth()
+            sqlite_auth.user_id_by_session_id = SQLiteSessionStore(
+                "sessions.sqlite3")
+            db_auth = SessionDBAuth()
+            token_auth = TokenAuth()
+            cases = [("session_auth memory", session_auth),
+                     ("session_auth sqlite", sqlite_auth),
+                     ("session_db_auth cold", db_auth),
+                     ("session_db_auth warm", db_auth),
+                     ("token_auth", token_auth)]
+            print(f"{'auth':>21} {'us/request':>11}")
+            for name, auth in cases:
+                if isinstance(auth, SessionDBAuth):
+                    session_ids = [f"s{i}" for i in random.sample(
+                        range(n), calls)] if name.endswith("cold") \
+                        else session_ids
+                else:
+                    session_ids = [auth.create_session(user.id)
+                                   for _ in range(n)]
+                    session_ids = random.sample(session_ids, calls)
+                elapsed = 0.0
+                for session_id in session_ids:
+                    cookie = f"{os.environ['SESSION_NAME']}={session_id}"
+                    with app.test_request_context(
+                            headers={"Cookie": cookie}):
+                        request.cookies
+                        start = time.perf_counter()
+                        found = auth.current_user(request)
+                        elapsed += time.perf_counter() - start
+                    assert found is user
+                print(f"{name:>21} {elapsed / calls * 1e6:>11.2f}")
+        finally:
+            DATA['User'] = {}
+            DATA['UserSession'] = {}
+            os.chdir(cwd)
+
+
+def bench_basic_auth() -> None:
+    """ BasicAuth current_user per request with 100k users (passwords
+    hashed by the PASSWORD_HASHER), without and with the
+    verified-credential cache (every header seen before)
+    """
+    import base64
+    from api.v1.app import app
+    from api.v1.auth.basic_auth import BasicAuth
+    from flask import request
+    users = populate(100000)
+    hashed = User()
+    hashed.password = "password"
+    for user in users:
+        user._password = hashed.password
+    picked = users[::1000]
+    headers = ["Basic " + base64.b64encode(
+        f"{user.email}:password".encode()).decode() for user in picked]
+    print(f"{'cache':>8} {'us/request':>11}")
+    try:
+        for name, ttl in [("off", "0"), ("on", "60")]:
+            os.environ["BASIC_AUTH_CACHE_TTL"] = ttl
+            auth = BasicAuth()
+            for header in headers:
+                with app.test_request_context(
+                        headers={"Authorization": header}):
+                    auth.current_user(request)
+            elapsed = 0.0
+            for header, user in zip(headers, picked):
+                with app.test_request_context(
+                        headers={"Authorization": header}):
+                    request.headers
+                    start = time.perf_counter()
+                    found = auth.current_user(request)
+                    elapsed += time.perf_counter() - start
+                assert found is user
+            print(f"{name:>8} {elapsed / len(headers) * 1e6:>11.2f}")
+    finally:
+        os.environ.pop("BASIC_AUTH_CACHE_TTL")
+        DATA['User'] = {}
+
+
+def bench_password_hash() -> None:
+    """ Password verification per hasher, then a burst of 16 concurrent
+    logins under three hashing pools: how many are served or turned
+    away, and how much slower a CPU-bound request runs meanwhile
+    """
+    import threading
+    from models import hashers
+    print(f"{'hasher':>8} {'ms/verify':>10}")
+    for name, hasher_cls in hashers.HASHERS.items():
+        try:
+            hasher = hasher_cls()
+        except ImportError:
+            continue
+        hashed = hasher.hash("password")
+        start = time.perf_counter()
+        hasher.verify("password", hashed)
+        print(f"{name:>8} {(time.perf_counter() - start) * 1e3:>10.2f}")
+
+    def probe() -> float:
+        start = time.perf_counter()
+        sum(i * i for i in range(20000))
+        return time.perf_counter() - start
+
+    idle = min(probe() for _ in range(20))
+    user = User()
+    user.password = "password"
+    print(f"{'workers':>8} {'queue':>6} {'served':>7} {'busy':>5} "
+          f"{'burst s':>8} {'request slowdown':>17}")
+    try:
+        for workers, queue in [(16, 0), (1, 15), (1, 3)]:
+            os.environ["PASSWORD_HASH_WORKERS"] = str(workers)
+            os.environ["PASSWORD_HASH_QUEUE"] = str(queue)
+            hashers._pool_pid = None
+            results = []
+
+            def login():
+                try:
+                    results.append(user.is_valid_password("password"))
+                except TimeoutError:
+                    results.append(None)
+
+            threads = [threading.Thread(target=login) for _ in range(16)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            probes = []
+            while any(thread.is_alive() for thread in threads):
+                probes.append(probe())
+            elapsed = time.perf_counter() - start
+            slowdown = sum(probes) / len(probes) / idle
+            print(f"{workers:>8} {queue:>6} {results.count(True):>7} "
+                  f"{results.count(None):>5} {elapsed:>8.2f} "
+                  f"{slowdown:>16.1f}x")
+    finally:
+        os.environ.pop("PASSWORD_HASH_WORKERS")
+        os.environ.pop("PASSWORD_HASH_QUEUE")
+        hashers._pool_pid = None
+
+
+BENCHMARKS = {
+    "search": bench_search,
+    "page": bench_page,
+    "load": bench_load,
+    "cold_start": bench_cold_start,
+    "serialize": bench_serialize,
+    "excluded_paths": bench_excluded_paths,
+    "session_db": bench_session_db,
+    "token_auth": bench_token_auth,
+    "basic_auth": bench_basic_auth,
+    "password_hash": bench_password_hash,
+}
+
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or BENCHMARKS:
+        print(f"== {name}")
+        BENCHMARKS[name]()
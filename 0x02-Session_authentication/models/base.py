@@ -1,21 +1,206 @@
 #!/usr/bin/env python3
 """ Base module
 """
+from bisect import bisect_left, bisect_right
+from collections import deque
 from datetime import datetime
-from typing import TypeVar, List, Iterable
-from os import path
+from itertools import repeat
+from operator import attrgetter
+from typing import TypeVar, List, Iterable, Iterator
+from os import getenv, path
+from models import snapshot
+from models.change_log import ChangeLog
+from models.sqlite_store import SQLiteStore, get_store
+import gc
 import json
+import os
+import tempfile
+import threading
 import uuid
 
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+TIMESTAMP_LENGTH = len("2017-09-28T21:05:33")
 DATA = {}
+JSON_KEYS = {}
+JSON_VALUES = {}
+INDEXES = {}
+SORTED_IDS = {}
+CHANGE_LOGS = {}
+SNAPSHOT_LOCKS = {}
+MODELS = {}
+VERSIONS = {}
+
+
+class Index:
+    """ Secondary hash index of the saved objects of a class on one
+    attribute: value -> {id: object}
+    """
+
+    def __init__(self, attr: str):
+        """ Initialize an empty index on attr
+        """
+        self.attr = attr
+        self.by_value = {}
+        self.by_id = {}
+
+    def add(self, obj: TypeVar('Base')):
+        """ Index obj under its current attribute value
+        """
+        self.discard(obj.id)
+        value = getattr(obj, self.attr, None)
+        self.by_value.setdefault(value, {})[obj.id] = obj
+        self.by_id[obj.id] = value
+
+    def discard(self, obj_id: str):
+        """ Drop an object from the index
+        """
+        if obj_id not in self.by_id:
+            return
+        value = self.by_id.pop(obj_id)
+        bucket = self.by_value[value]
+        del bucket[obj_id]
+        if not bucket:
+            del self.by_value[value]
+
+    def rebuild(self, objs: dict):
+        """ Re-index all the objects of {id: object} at once
+        """
+        self.by_value = {}
+        self.by_id = {}
+        for obj_id, obj in objs.items():
+            value = getattr(obj, self.attr, None)
+            self.by_value.setdefault(value, {})[obj_id] = obj
+            self.by_id[obj_id] = value
+
+    def lookup(self, value) -> List[TypeVar('Base')]:
+        """ Objects indexed under value
+        """
+        return list(self.by_value.get(value, {}).values())
+
+    def __len__(self) -> int:
+        """ Number of distinct indexed values
+        """
+        return len(self.by_value)
+
+
+class SortedIds:
+    """ IDs of the saved objects of a class in order, for keyset
+    pagination: sorted chunks of at most 2 * CHUNK IDs, so adding or
+    discarding one shifts a chunk, not the whole list
+    """
+    CHUNK = 1000
+
+    def __init__(self, ids: Iterable[str] = ()):
+        """ Initialize with ids
+        """
+        ids = sorted(ids)
+        self.chunks = [ids[i:i + self.CHUNK]
+                       for i in range(0, len(ids), self.CHUNK)]
+        self.maxes = [chunk[-1] for chunk in self.chunks]
+        self.size = len(ids)
+
+    def add(self, obj_id: str):
+        """ Insert obj_id if missing
+        """
+        if not self.chunks:
+            self.chunks.append([obj_id])
+            self.maxes.append(obj_id)
+            self.size = 1
+            return
+        i = min(bisect_left(self.maxes, obj_id), len(self.maxes) - 1)
+        chunk = self.chunks[i]
+        j = bisect_left(chunk, obj_id)
+        if j < len(chunk) and chunk[j] == obj_id:
+            return
+        chunk.insert(j, obj_id)
+        self.maxes[i] = chunk[-1]
+        self.size += 1
+        if len(chunk) > 2 * self.CHUNK:
+            self.chunks[i:i + 1] = [chunk[:self.CHUNK], chunk[self.CHUNK:]]
+            self.maxes[i:i + 1] = [chunk[self.CHUNK - 1], chunk[-1]]
+
+    def discard(self, obj_id: str):
+        """ Remove obj_id if present
+        """
+        i = bisect_left(self.maxes, obj_id)
+        if i == len(self.maxes):
+            return
+        chunk = self.chunks[i]
+        j = bisect_left(chunk, obj_id)
+        if j == len(chunk) or chunk[j] != obj_id:
+            return
+        del chunk[j]
+        self.size -= 1
+        if chunk:
+            self.maxes[i] = chunk[-1]
+        else:
+            del self.chunks[i]
+            del self.maxes[i]
+
+    def after(self, after: str = None, limit: int = 100) -> List[str]:
+        """ At most limit IDs greater than after (from the first if
+        None), in order
+        """
+        i = 0 if after is None else bisect_right(self.maxes, after)
+        if i == len(self.chunks):
+            return []
+        j = 0 if after is None else bisect_right(self.chunks[i], after)
+        ids = []
+        while i < len(self.chunks) and len(ids) < limit:
+            ids.extend(self.chunks[i][j:j + limit - len(ids)])
+            i += 1
+            j = 0
+        return ids
+
+    def __len__(self) -> int:
+        """ Number of IDs
+        """
+        return self.size
+
+
+class Timestamp:
+    """ Timestamp attribute kept as its TIMESTAMP_FORMAT string (as loaded
+    from the store) until it is first read, then parsed once
+    """
+
+    def __set_name__(self, owner: type, name: str):
+        """ Value is stored in the _<name> slot
+        """
+        self.slot = f"_{name}"
+
+    def __get__(self, obj: TypeVar('Base'), objtype: type = None):
+        """ Parse the stored string on first access
+        """
+        if obj is None:
+            return self
+        value = getattr(obj, self.slot)
+        if isinstance(value, str):
+            value = datetime.strptime(value, TIMESTAMP_FORMAT)
+            setattr(obj, self.slot, value)
+        return value
+
+    def __set__(self, obj: TypeVar('Base'), value):
+        """ Store a datetime or a TIMESTAMP_FORMAT string
+        """
+        if isinstance(value, str) and len(value) != TIMESTAMP_LENGTH:
+            # not in canonical form: parse now so to_json normalizes it
+            value = datetime.strptime(value, TIMESTAMP_FORMAT)
+        setattr(obj, self.slot, value)
 
 
 class Base:
     """ Base class
+    Attributes live in __slots__ (no per-instance __dict__); to_json
+    walks the slots of the class hierarchy in declaration order.
     """
 
+    INDEXES = ()
+    __slots__ = ('id', '_created_at', '_updated_at', '_revision',
+                 '_json_cache')
+    created_at = Timestamp()
+    updated_at = Timestamp()
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
         """
@@ -23,35 +208,436 @@ class Base:
         if DATA.get(s_class) is None:
             DATA[s_class] = {}
 
-        self.id = kwargs.get('id', str(uuid.uuid4()))
+        self.id = kwargs['id'] if 'id' in kwargs else str(uuid.uuid4())
         if kwargs.get('created_at') is not None:
-            self.created_at = datetime.strptime(kwargs['created_at'], TIMESTAMP_FORMAT)
+            self.created_at = kwargs['created_at']
         else:
             self.created_at = datetime.utcnow()
         if kwargs.get('updated_at') is not None:
-            self.updated_at = datetime.strptime(kwargs['updated_at'], TIMESTAMP_FORMAT)
+            self.updated_at = kwargs['updated_at']
         else:
             self.updated_at = datetime.utcnow()
+        self._revision = kwargs.get('_revision') or 0
+
+    def __init_subclass__(cls, **kwargs):
+        """ Register every model class in MODELS
+        """
+        super().__init_subclass__(**kwargs)
+        MODELS[cls.__name__] = cls
 
     def __eq__(self, other: TypeVar('Base')) -> bool:
         """ Check equality
         """
         return isinstance(other, Base) and self.id == other.id
 
-    def to_json(self, for_serialization: bool = False) -> dict:
-        """ Convert the object to a JSON dictionary
+    @property
+    def revision(self) -> int:
+        """ Number of saves of the object (stored with it, not shown by
+        to_json): tells apart the saves of one second
         """
-        result = {}
-        for key, value in self.__dict__.items():
-            if not for_serialization and key.startswith('_'):
-                continue
-            result[key] = value.strftime(TIMESTAMP_FORMAT) if isinstance(value, datetime) else value
-        return result
+        return self._revision or 0
+
+    @classmethod
+    def _json_keys(cls) -> List[tuple]:
+        """ (slot, JSON key) pairs of the class, computed once
+        """
+        keys = JSON_KEYS.get(cls)
+        if keys is None:
+            keys = [(slot, slot[1:] if slot in ('_created_at', '_updated_at')
+                     else slot)
+                    for klass in reversed(cls.__mro__)
+                    for slot in klass.__dict__.get('__slots__', ())
+                    if slot != '_json_cache']
+            JSON_KEYS[cls] = keys
+            JSON_VALUES[cls] = attrgetter(*(slot for slot, key in keys))
+        return keys
+
+    def to_json(self, for_serialization: bool = False,
+                fields: Iterable[str] = None) -> dict:
+        """ Convert the object to a JSON dictionary, restricted to fields
+        if given. Both forms are cached with the attribute values they
+        were built from; any attribute change invalidates them.
+        """
+        keys = self._json_keys()
+        values = JSON_VALUES[self.__class__](self)
+        cache = getattr(self, '_json_cache', None)
+        if cache is None or cache[0] != values:
+            cache = self._json_cache = [values, None, None]
+        form = 1 if for_serialization else 2
+        result = cache[form]
+        if result is None:
+            result = cache[form] = {
+                key: value.strftime(TIMESTAMP_FORMAT)
+                if isinstance(value, datetime) else value
+                for (slot, key), value in zip(keys, values)
+                if for_serialization or not key.startswith('_')}
+        if fields is not None:
+            return {key: result[key] for key in fields if key in result}
+        return dict(result)
 
     @classmethod
     def load_from_file(cls):
-        """ Load all objects from a file
+        """ Load all objects from a file, then replay the change log
+        """
+        s_class = cls.__name__
+        file_path = f".db_{s_class}.json"
+        DATA[s_class] = {}
+        VERSIONS.pop(s_class, None)
+        cls._reset_indexes()
+        if cls._backend() is not None:
+            return
+        # only long-lived objects are created here: skip the cyclic GC
+        # passes that would otherwise rescan them over and over
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            if not cls._load_binary_snapshot() and path.exists(file_path):
+                with open(file_path, 'r') as f:
+                    objs_json = json.load(f)
+                    for obj_id, obj_json in objs_json.items():
+                        DATA[s_class][obj_id] = cls(**obj_json)
+            for index in INDEXES[s_class].values():
+                index.rebuild(DATA[s_class])
+            SORTED_IDS[s_class] = SortedIds(DATA[s_class])
+        finally:
+            if gc_enabled:
+                gc.enable()
+        if cls._change_log() is None:
+            return
+        for record in cls._change_log().replay():
+            if record['op'] == 'save':
+                obj = cls(**record['obj'])
+                DATA[s_class][obj.id] = obj
+                cls._index(obj)
+            elif DATA[s_class].pop(record['id'], None) is not None:
+                cls._unindex(record['id'])
+
+    @classmethod
+    def _load_binary_snapshot(cls) -> bool:
+        """ Load DATA from .db_<Class>.bin when BASE_SNAPSHOT is "binary"
+        and the file is not older than the JSON one. Objects are rebuilt
+        slot by slot, without calling __init__.
+        Return: False when the JSON file must be loaded instead
+        """
+        s_class = cls.__name__
+        bin_path = f".db_{s_class}.bin"
+        json_path = f".db_{s_class}.json"
+        if getenv("BASE_SNAPSHOT") != "binary" or not path.exists(bin_path):
+            return False
+        if path.exists(json_path) and \
+                path.getmtime(bin_path) < path.getmtime(json_path):
+            return False
+        try:
+            count, columns = snapshot.load(bin_path)
+        except ValueError:
+            return False
+        if count and 'id' not in columns:
+            return False
+        objs = [cls.__new__(cls) for _ in range(count)]
+        for slot, key in cls._json_keys():
+            # fill one slot of every object through its C-level setter
+            setter = getattr(cls, slot).__set__
+            deque(map(setter, objs, columns.get(key, repeat(None))), 0)
+        DATA[s_class] = dict(zip(columns.get('id', ()), objs))
+        return True
+
+    @classmethod
+    def save_to_file(cls):
+        """ Save all objects to a file
+        """
+        if cls._backend() is None:
+            cls._write_snapshot(DATA[cls.__name__])
+
+    @classmethod
+    def _write_snapshot(cls, objs: dict, durable: bool = False):
+        """ Atomically replace .db_<Class>.json (and .db_<Class>.bin when
+        BASE_SNAPSHOT is "binary") with objs; fsync first if durable
         """
         s_class = cls.__name__
         file_path = f".db_{s_class}.json"
-        DATA[s_class].values()))
+        with cls._snapshot_lock():
+            objs_json = {}
+            for obj_id, obj in list(objs.items()):
+                objs_json[obj_id] = obj.to_json(True)
+
+            # a temporary file of our own: other workers share the folder
+            fd, tmp_path = tempfile.mkstemp(prefix=file_path + ".", dir=".")
+            try:
+                with open(fd, 'w') as f:
+                    json.dump(objs_json, f)
+                    if durable:
+                        f.flush()
+                        os.fsync(f.fileno())
+                os.replace(tmp_path, file_path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+            bin_path = f".db_{s_class}.bin"
+            if getenv("BASE_SNAPSHOT") == "binary" and \
+                    not snapshot.dump(bin_path, objs_json.values()) and \
+                    path.exists(bin_path):
+                os.remove(bin_path)
+
+    @classmethod
+    def _snapshot_lock(cls) -> threading.RLock:
+        """ Lock of the snapshot files of the class, held while a new
+        snapshot is built and renamed over them
+        """
+        return SNAPSHOT_LOCKS.setdefault(cls.__name__, threading.RLock())
+
+    def save(self):
+        """ Save the current object
+        """
+        s_class = self.__class__.__name__
+        self.updated_at = datetime.utcnow()
+        self._revision = (self._revision or 0) + 1
+        if self.__class__._backend() is not None:
+            return self.__class__._backend().save(self)
+        DATA[s_class][self.id] = self
+        self.__class__._index(self)
+        self.__class__._version_state()[2] += 1
+        change_log = self.__class__._change_log()
+        if change_log is None:
+            self.__class__.save_to_file()
+        else:
+            change_log.append({'op': 'save', 'obj': self.to_json(True)},
+                              lambda: DATA[s_class])
+
+    def remove(self):
+        """ Remove the current object
+        """
+        s_class = self.__class__.__name__
+        if self.__class__._backend() is not None:
+            return self.__class__._backend().remove(self)
+        if DATA[s_class].get(self.id) is not None:
+            del DATA[s_class][self.id]
+            self.__class__._unindex(self.id)
+            self.__class__._version_state()[2] += 1
+            change_log = self.__class__._change_log()
+            if change_log is None:
+                self.__class__.save_to_file()
+            else:
+                change_log.append({'op': 'remove', 'id': self.id},
+                                  lambda: DATA[s_class])
+
+    @classmethod
+    def save_batch(cls, saved: Iterable[TypeVar('Base')] = (),
+                   removed: Iterable[TypeVar('Base')] = ()):
+        """ save() every object of saved and remove() every object of
+        removed (no object in both), persisting them all at once
+        """
+        saved, removed = list(saved), list(removed)
+        now = datetime.utcnow()
+        for obj in saved:
+            obj.updated_at = now
+            obj._revision = (obj._revision or 0) + 1
+        if cls._backend() is not None:
+            return cls._backend().save_batch(cls, saved, removed)
+        s_class = cls.__name__
+        objs = DATA.setdefault(s_class, {})
+        records = []
+        for obj in saved:
+            objs[obj.id] = obj
+            cls._index(obj)
+            records.append({'op': 'save', 'obj': obj.to_json(True)})
+        for obj in removed:
+            if objs.pop(obj.id, None) is not None:
+                cls._unindex(obj.id)
+                records.append({'op': 'remove', 'id': obj.id})
+        if not records:
+            return
+        cls._version_state()[2] += 1
+        change_log = cls._change_log()
+        if change_log is None:
+            cls.save_to_file()
+            return
+        for record in records:
+            change_log.append(record, lambda: DATA[s_class])
+
+    @classmethod
+    def count(cls) -> int:
+        """ Count all objects
+        """
+        if cls._backend() is not None:
+            return cls._backend().count(cls)
+        s_class = cls.__name__
+        return len(DATA[s_class].keys())
+
+    @classmethod
+    def version(cls) -> str:
+        """ Opaque version of the objects of the class, changed by every
+        save and remove (e.g. for the ETag of a list)
+        """
+        if cls._backend() is not None:
+            return str(cls._backend().version(cls))
+        return "{1}.{2}".format(*cls._version_state())
+
+    @classmethod
+    def _version_state(cls) -> list:
+        """ [pid, token, counter] of the in-memory version: the token
+        is drawn anew in each process and at each load, as two processes
+        can hold different objects under the same counter
+        """
+        s_class = cls.__name__
+        state = VERSIONS.get(s_class)
+        if state is None or state[0] != os.getpid():
+            state = VERSIONS[s_class] = [os.getpid(), uuid.uuid4().hex[:8], 0]
+        return state
+
+    @classmethod
+    def stats(cls) -> dict:
+        """ Store metrics of the class, none of which reads the objects:
+        storage mode, object count, bytes of its files on disk, last time
+        one of them was written (UTC) and distinct values per index
+        """
+        s_class = cls.__name__
+        backend = cls._backend()
+        if backend is not None:
+            storage, files, indexes = "sqlite", backend.files(), {}
+        else:
+            storage = "file" if cls._change_log() is None else "log"
+            files = [f".db_{s_class}{ext}" for ext in
+                     (".json", ".bin", ".log", ".log.compacting")]
+            indexes = {attr: len(index) for attr, index
+                       in INDEXES.get(s_class, {}).items()}
+        size, mtime = 0, None
+        for file_path in files:
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                continue
+            size += stat.st_size
+            mtime = max(mtime or 0, stat.st_mtime)
+        return {
+            "storage": storage,
+            "count": cls.count() if s_class in DATA or backend else 0,
+            "bytes": size,
+            "last_persisted": None if mtime is None else
+            datetime.utcfromtimestamp(mtime).strftime(TIMESTAMP_FORMAT),
+            "indexes": indexes,
+        }
+
+    @classmethod
+    def all(cls) -> Iterable[TypeVar('Base')]:
+        """ Return all objects
+        """
+        return cls.search()
+
+    @classmethod
+    def page(cls, after: str = None,
+             limit: int = 100) -> List[TypeVar('Base')]:
+        """ Keyset pagination: at most limit objects with an ID greater
+        than after, in ID order
+        """
+        if cls._backend() is not None:
+            return cls._backend().page(cls, after, limit)
+        objs = DATA[cls.__name__]
+        return [objs[obj_id]
+                for obj_id in cls._sorted_ids().after(after, limit)]
+
+    @classmethod
+    def iterate(cls, batch_size: int = 1000) -> Iterator[TypeVar('Base')]:
+        """ Yield all objects in ID order, batch_size at a time, without
+        building their list (objects removed meanwhile are skipped)
+        """
+        after = None
+        while True:
+            objs = cls.page(after, batch_size)
+            yield from objs
+            if len(objs) < batch_size:
+                return
+            after = objs[-1].id
+
+    @classmethod
+    def get(cls, id: str) -> TypeVar('Base'):
+        """ Return one object by ID
+        """
+        if cls._backend() is not None:
+            return cls._backend().get(cls, id)
+        s_class = cls.__name__
+        return DATA[s_class].get(id)
+
+    @classmethod
+    def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
+        """ Search all objects with matching attributes.
+        When one of the attributes is indexed, only the objects found
+        in that index are checked.
+        """
+        if cls._backend() is not None:
+            return cls._backend().search(cls, attributes)
+        s_class = cls.__name__
+        objs = DATA[s_class].values()
+        indexes = INDEXES.get(s_class, {})
+        for key, value in attributes.items():
+            if key in indexes:
+                objs = indexes[key].lookup(value)
+                break
+
+        def _search(obj):
+            if len(attributes) == 0:
+                return True
+            for k, v in attributes.items():
+                if (getattr(obj, k) != v):
+                    return False
+            return True
+
+        return list(filter(_search, objs))
+
+    @classmethod
+    def _backend(cls) -> SQLiteStore:
+        """ Shared store holding the objects when BASE_STORAGE is
+        "sqlite"; None when they live in DATA (and in files)
+        """
+        if getenv("BASE_STORAGE") != "sqlite":
+            return None
+        return get_store()
+
+    @classmethod
+    def _change_log(cls) -> ChangeLog:
+        """ Change log of the class when BASE_STORAGE is "log", else None
+        (every save rewrites the whole .db_<Class>.json file)
+        """
+        if getenv("BASE_STORAGE") != "log":
+            return None
+        s_class = cls.__name__
+        if s_class not in CHANGE_LOGS:
+            CHANGE_LOGS[s_class] = ChangeLog(
+                s_class, lambda objs: cls._write_snapshot(objs, True),
+                cls._snapshot_lock())
+        return CHANGE_LOGS[s_class]
+
+    @classmethod
+    def _reset_indexes(cls):
+        """ (Re)create the empty indexes declared in INDEXES
+        """
+        INDEXES[cls.__name__] = {attr: Index(attr) for attr in cls.INDEXES}
+        SORTED_IDS[cls.__name__] = SortedIds()
+
+    @classmethod
+    def _sorted_ids(cls) -> SortedIds:
+        """ Sorted IDs of the saved objects of the class
+        """
+        s_class = cls.__name__
+        if s_class not in SORTED_IDS:
+            SORTED_IDS[s_class] = SortedIds(DATA.get(s_class, {}))
+        return SORTED_IDS[s_class]
+
+    @classmethod
+    def _index(cls, obj: TypeVar('Base')):
+        """ Add or refresh an object in the class indexes
+        """
+        s_class = cls.__name__
+        if s_class not in INDEXES:
+            cls._reset_indexes()
+        for index in INDEXES[s_class].values():
+            index.add(obj)
+        SORTED_IDS[s_class].add(obj.id)
+
+    @classmethod
+    def _unindex(cls, obj_id: str):
+        """ Drop an object from the class indexes
+        """
+        for index in INDEXES.get(cls.__name__, {}).values():
+            index.discard(obj_id)
+        if cls.__name__ in SORTED_IDS:
+            SORTED_IDS[cls.__name__].discard(obj_id)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+""" Append-only change log of a model class, compacted into the
+.db_<Class>.json snapshot in the background
+"""
+from os import getenv, path
+from typing import Callable, Dict, Iterator
+import json
+import os
+import threading
+
+
+class ChangeLog:
+    """ .db_<Class>.log holds one JSON record per save or remove made
+    since the last snapshot. Compaction moves the log aside, then has
+    write_snapshot write a new snapshot to a temporary file and rename
+    it over the old one, so a crash at any point leaves snapshot + logs
+    replaying to the same state (records are idempotent).
+    """
+
+    def __init__(self, s_class: str, write_snapshot: Callable[[Dict], None],
+                 snapshot_lock: threading.RLock = None):
+        """ Initialize the change log of the class named s_class;
+        write_snapshot({id: object}) atomically replaces its snapshot,
+        under snapshot_lock, shared with the other writers of it
+        """
+        self.write_snapshot = write_snapshot
+        self.snapshot_lock = snapshot_lock or threading.RLock()
+        self.log_path = f".db_{s_class}.log"
+        self.compacting_path = f".db_{s_class}.log.compacting"
+        self.compact_every = int(getenv("BASE_LOG_COMPACT_EVERY", 1000))
+        self.records = 0
+        self._file = None
+        self._lock = threading.Lock()
+        self._compactor = None
+
+    def replay(self) -> Iterator[dict]:
+        """ Records to apply over the snapshot, oldest first
+        """
+        self.records = 0
+        for file_path in (self.compacting_path, self.log_path):
+            if not path.exists(file_path):
+                continue
+            offset = 0
+            with open(file_path, 'rb') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # torn last line of a crashed append: cut it so
+                        # the next append starts on a fresh line
+                        os.truncate(file_path, offset)
+                        break
+                    offset += len(line)
+                    self.records += 1
+                    yield record
+
+    def append(self, record: dict, objects: Callable[[], Dict]):
+        """ Append one record; start a background compaction once
+        compact_every records are logged. objects returns the current
+        {id: object} of the class.
+        """
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.log_path, 'a')
+            self._file.write(line)
+            self._file.flush()
+            self.records += 1
+            start = self.records >= self.compact_every and \
+                self._compactor is None
+            if start:
+                self._compactor = threading.Thread(
+                    target=self.compact, args=(objects,), daemon=True)
+        if start:
+            self._compactor.start()
+
+    def compact(self, objects: Callable[[], Dict]):
+        """ Fold the log into a new snapshot
+        """
+        try:
+            with self.snapshot_lock:
+                with self._lock:
+                    if self._file is not None:
+                        self._file.close()
+                        self._file = None
+                    if path.exists(self.log_path) and \
+                            not path.exists(self.compacting_path):
+                        os.replace(self.log_path, self.compacting_path)
+                    self.records = 0
+                    objs = dict(objects())
+                self.write_snapshot(objs)
+                if path.exists(self.compacting_path):
+                    os.remove(self.compacting_path)
+        finally:
+            self._compactor = None
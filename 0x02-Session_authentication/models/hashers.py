@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+""" Password hashers of User
+"""
+from concurrent.futures import ThreadPoolExecutor
+from os import getenv
+from typing import Callable, Dict, Optional
+import hashlib
+import hmac
+import os
+import threading
+
+
+class Hasher:
+    """ Interface of the password hashers: hash(pwd) makes a stored hash,
+    which verify(pwd, hashed) checks; identify(hashed) tells whether a
+    stored hash is of this hasher. Expensive hashers run on the hashing
+    pool (see run)
+    """
+    expensive = True
+
+    def hash(self, pwd: str) -> str:
+        """ Stored hash of pwd
+        """
+        raise NotImplementedError
+
+    def verify(self, pwd: str, hashed: str) -> bool:
+        """ Whether hashed is the hash of pwd
+        """
+        raise NotImplementedError
+
+    def identify(self, hashed: str) -> bool:
+        """ Whether hashed was made by this hasher
+        """
+        raise NotImplementedError
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """ Whether hashed, made by this hasher, uses weaker settings than
+        the current ones
+        """
+        return False
+
+
+class SHA256Hasher(Hasher):
+    """ Legacy unsalted SHA-256 hashes (64 hex digits), only kept to
+    verify the passwords stored before work-factor hashes
+    """
+    expensive = False
+
+    def hash(self, pwd: str) -> str:
+        """ Hex SHA-256 of pwd
+        """
+        return hashlib.sha256(pwd.encode()).hexdigest().lower()
+
+    def verify(self, pwd: str, hashed: str) -> bool:
+        """ Whether hashed is the hex SHA-256 of pwd
+        """
+        return hmac.compare_digest(self.hash(pwd), hashed)
+
+    def identify(self, hashed: str) -> bool:
+        """ 64 hex digits
+        """
+        return len(hashed) == 64 and \
+            all(c in "0123456789abcdef" for c in hashed)
+
+
+class BcryptHasher(Hasher):
+    """ bcrypt hashes ("$2b$<rounds>$..."), rounds from
+    PASSWORD_BCRYPT_ROUNDS (12); needs the bcrypt package
+    """
+
+    def __init__(self, rounds: int = None):
+        """ Initialize with a cost of rounds
+        """
+        import bcrypt
+        self.bcrypt = bcrypt
+        self.rounds = rounds or int(getenv("PASSWORD_BCRYPT_ROUNDS", 12))
+
+    def hash(self, pwd: str) -> str:
+        """ bcrypt hash of pwd with a new salt
+        """
+        return self.bcrypt.hashpw(
+            pwd.encode(), self.bcrypt.gensalt(rounds=self.rounds)).decode()
+
+    def verify(self, pwd: str, hashed: str) -> bool:
+        """ bcrypt check of pwd against hashed
+        """
+        try:
+            return self.bcrypt.checkpw(pwd.encode(), hashed.encode())
+        except ValueError:
+            return False
+
+    def identify(self, hashed: str) -> bool:
+        """ "$2a$", "$2b$" or "$2y$" prefix
+        """
+        return hashed[:4] in ("$2a$", "$2b$", "$2y$")
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """ Whether hashed has fewer rounds than self.rounds
+        """
+        try:
+            return int(hashed.split("$")[2]) < self.rounds
+        except (IndexError, ValueError):
+            return True
+
+
+class ScryptHasher(Hasher):
+    """ scrypt hashes ("scrypt$<n>$<r>$<p>$<salt>$<hash>", hex), n from
+    PASSWORD_SCRYPT_N (16384), r = 8 and p = 1
+    """
+
+    def __init__(self, n: int = None, r: int = 8, p: int = 1):
+        """ Initialize with the scrypt cost parameters
+        """
+        self.n = n or int(getenv("PASSWORD_SCRYPT_N", 16384))
+        self.r = r
+        self.p = p
+
+    def _derive(self, pwd: str, salt: bytes, n: int, r: int, p: int) -> str:
+        """ Hex scrypt key of pwd
+        """
+        return hashlib.scrypt(pwd.encode(), salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * n * r + (1 << 20),
+                              dklen=32).hex()
+
+    def hash(self, pwd: str) -> str:
+        """ scrypt hash of pwd with a new salt
+        """
+        salt = os.urandom(16)
+        return "scrypt${}${}${}${}${}".format(
+            self.n, self.r, self.p, salt.hex(),
+            self._derive(pwd, salt, self.n, self.r, self.p))
+
+    def verify(self, pwd: str, hashed: str) -> bool:
+        """ scrypt check of pwd against hashed, with its own parameters
+        """
+        try:
+            _, n, r, p, salt, key = hashed.split("$")
+            derived = self._derive(pwd, bytes.fromhex(salt),
+                                   int(n), int(r), int(p))
+        except ValueError:
+            return False
+        return hmac.compare_digest(derived, key)
+
+    def identify(self, hashed: str) -> bool:
+        """ "scrypt$" prefix
+        """
+        return hashed.startswith("scrypt$")
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """ Whether hashed has other cost parameters than this hasher
+        """
+        return hashed.split("$")[1:4] != \
+            [str(self.n), str(self.r), str(self.p)]
+
+
+HASHERS = {
+    "sha256": SHA256Hasher,
+    "bcrypt": BcryptHasher,
+    "scrypt": ScryptHasher,
+}
+
+
+def make_hasher() -> Hasher:
+    """ Hasher of new passwords selected by PASSWORD_HASHER: scrypt
+    (default), bcrypt or sha256 (legacy)
+    """
+    name = getenv("PASSWORD_HASHER", "scrypt")
+    if name not in HASHERS:
+        raise ValueError(f"unknown PASSWORD_HASHER: {name}")
+    return HASHERS[name]()
+
+
+_known: Dict[str, Hasher] = {}
+
+
+def hasher_of(hashed: str, current: Hasher) -> Optional[Hasher]:
+    """ Hasher that made hashed: current, else one of HASHERS with its
+    default settings (those whose package is missing skipped), else None
+    """
+    if current.identify(hashed):
+        return current
+    for name, hasher_cls in HASHERS.items():
+        if name not in _known:
+            try:
+                _known[name] = hasher_cls()
+            except ImportError:
+                continue
+        if _known[name].identify(hashed):
+            return _known[name]
+    return None
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_slots: Optional[threading.BoundedSemaphore] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+
+def _pool() -> ThreadPoolExecutor:
+    """ Hashing pool of PASSWORD_HASH_WORKERS threads (one per core by
+    default), holding at most PASSWORD_HASH_QUEUE (4 per worker) more
+    hashes waiting; a forked worker makes its own
+    """
+    global _executor, _slots, _pool_pid
+    with _pool_lock:
+        if _pool_pid != os.getpid():
+            _pool_pid = os.getpid()
+            workers = int(getenv("PASSWORD_HASH_WORKERS", os.cpu_count()))
+            queue = int(getenv("PASSWORD_HASH_QUEUE", 4 * workers))
+            _slots = threading.BoundedSemaphore(workers + queue)
+            _executor = ThreadPoolExecutor(workers,
+                                           thread_name_prefix="hasher")
+    return _executor
+
+
+def run(hasher: Hasher, func: Callable, *args):
+    """ func(*args) of hasher: inline if hasher is cheap, else on the
+    hashing pool, waiting at most PASSWORD_HASH_TIMEOUT seconds (0 by
+    default) for a place in it. bcrypt and scrypt release the GIL, so
+    the pool bounds the hashes running at once: a burst of logins waits
+    for the pool, or fails fast with TimeoutError once it is full,
+    instead of taking every CPU from the other requests
+    """
+    if not hasher.expensive:
+        return func(*args)
+    pool = _pool()
+    if not _slots.acquire(
+            timeout=float(getenv("PASSWORD_HASH_TIMEOUT", 0))):
+        raise TimeoutError("password hashing pool is full")
+    try:
+        future = pool.submit(func, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return future.result()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+""" SQLite storage backend for Base, shared by every worker process
+"""
+from os import getenv
+from typing import List, TypeVar
+import json
+import os
+import random
+import sqlite3
+import threading
+
+
+class SQLiteStore:
+    """ Stores each model class in a table of a SQLite database in WAL
+    mode: one row per object with its to_json(True) document, plus one
+    indexed column per attribute listed in the class INDEXES.
+    Row counts and table versions are kept in the _counts and _versions
+    tables by triggers, so count() and version() are single-row reads.
+    Every process and thread gets its own connection; all statements are
+    parameterized, so sqlite3 reuses their prepared form.
+    """
+
+    def __init__(self, db_path: str):
+        """ Initialize a store on the database file db_path
+        """
+        self.db_path = db_path
+        self._local = threading.local()
+        self._tables = set()
+
+    def _connection(self) -> sqlite3.Connection:
+        """ Connection of the current thread (reopened after a fork)
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30,
+                                   isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _table(self, cls: type) -> str:
+        """ Table of cls, created with its indexes on first use
+        """
+        table = cls.__name__
+        if table not in self._tables:
+            conn = self._connection()
+            columns = "".join(f', "{attr}"' for attr in cls.INDEXES)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" '
+                             f'(id TEXT PRIMARY KEY, data TEXT NOT NULL'
+                             f'{columns})')
+                for attr in cls.INDEXES:
+                    conn.execute(f'CREATE INDEX IF NOT EXISTS '
+                                 f'"{table}_{attr}" ON "{table}" ("{attr}")')
+                conn.execute('CREATE TABLE IF NOT EXISTS "_counts" '
+                             '(name TEXT PRIMARY KEY, n INTEGER NOT NULL)')
+                if conn.execute('SELECT 1 FROM "_counts" WHERE name = ?',
+                                (table,)).fetchone() is None:
+                    # first use of this table: count its rows once
+                    conn.execute(f'INSERT INTO "_counts" '
+                                 f'SELECT ?, COUNT(*) FROM "{table}"',
+                                 (table,))
+                for event, delta in (("INSERT", "+ 1"), ("DELETE", "- 1")):
+                    conn.execute(
+                        f'CREATE TRIGGER IF NOT EXISTS '
+                        f'"{table}_count_{event.lower()}" '
+                        f'AFTER {event} ON "{table}" BEGIN '
+                        f'UPDATE "_counts" SET n = n {delta} '
+                        f'WHERE name = \'{table}\'; END')
+                # versions start at a random value so that a recreated
+                # database does not repeat the versions of the old one
+                conn.execute('CREATE TABLE IF NOT EXISTS "_versions" '
+                             '(name TEXT PRIMARY KEY, n INTEGER NOT NULL)')
+                conn.execute('INSERT OR IGNORE INTO "_versions" '
+                             'VALUES (?, ?)', (table, random.getrandbits(48)))
+                for event in ("INSERT", "UPDATE", "DELETE"):
+                    conn.execute(
+                        f'CREATE TRIGGER IF NOT EXISTS '
+                        f'"{table}_version_{event.lower()}" '
+                        f'AFTER {event} ON "{table}" BEGIN '
+                        f'UPDATE "_versions" SET n = n + 1 '
+                        f'WHERE name = \'{table}\'; END')
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self._tables.add(table)
+        return table
+
+    def save(self, obj: TypeVar('Base')):
+        """ Insert or update obj
+        """
+        cls = obj.__class__
+        self._connection().execute(self._upsert(cls), self._row(obj))
+
+    def save_batch(self, cls: type, saved: List[TypeVar('Base')],
+                   removed: List[TypeVar('Base')]):
+        """ Insert or update saved and delete removed in one transaction
+        """
+        table = self._table(cls)
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(self._upsert(cls), map(self._row, saved))
+            conn.executemany(f'DELETE FROM "{table}" WHERE id = ?',
+                             [(obj.id,) for obj in removed])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _upsert(self, cls: type) -> str:
+        """ Statement saving one object of cls (an upsert, not a REPLACE,
+        so that the insert triggers only count new rows)
+        """
+        table = self._table(cls)
+        columns = "".join(f', "{attr}"' for attr in cls.INDEXES)
+        marks = ", ?" * len(cls.INDEXES)
+        updates = "".join(f', "{attr}" = excluded."{attr}"'
+                          for attr in cls.INDEXES)
+        return (f'INSERT INTO "{table}" (id, data{columns}) '
+                f'VALUES (?, ?{marks}) ON CONFLICT (id) DO UPDATE SET '
+                f'data = excluded.data{updates}')
+
+    def _row(self, obj: TypeVar('Base')) -> list:
+        """ Parameters of _upsert for obj
+        """
+        return [obj.id, json.dumps(obj.to_json(True))] + \
+            [getattr(obj, attr, None) for attr in obj.__class__.INDEXES]
+
+    def remove(self, obj: TypeVar('Base')):
+        """ Delete obj
+        """
+        table = self._table(obj.__class__)
+        self._connection().execute(f'DELETE FROM "{table}" WHERE id = ?',
+                                   (obj.id,))
+
+    def count(self, cls: type) -> int:
+        """ Number of objects of cls
+        """
+        table = self._table(cls)
+        return self._connection().execute(
+            'SELECT n FROM "_counts" WHERE name = ?', (table,)).fetchone()[0]
+
+    def version(self, cls: type) -> int:
+        """ Version of the objects of cls, changed by every write
+        """
+        table = self._table(cls)
+        return self._connection().execute(
+            'SELECT n FROM "_versions" WHERE name = ?', (table,)).fetchone()[0]
+
+    def files(self) -> List[str]:
+        """ Files of the database on disk
+        """
+        return [self.db_path, self.db_path + "-wal"]
+
+    def get(self, cls: type, id: str) -> TypeVar('Base'):
+        """ Object of cls with this id, or None
+        """
+        table = self._table(cls)
+        row = self._connection().execute(
+            f'SELECT data FROM "{table}" WHERE id = ?', (id,)).fetchone()
+        return cls(**json.loads(row[0])) if row else None
+
+    def page(self, cls: type, after: str,
+             limit: int) -> List[TypeVar('Base')]:
+        """ At most limit objects of cls with an id greater than after,
+        in id order (walks the primary key index)
+        """
+        table = self._table(cls)
+        rows = self._connection().execute(
+            f'SELECT data FROM "{table}" WHERE id > ? ORDER BY id LIMIT ?',
+            (after or "", limit))
+        return [cls(**json.loads(data)) for (data,) in rows]
+
+    def search(self, cls: type, attributes: dict) -> List[TypeVar('Base')]:
+        """ Objects of cls matching attributes: id and indexed attributes
+        are matched in SQL, the others on the loaded objects
+        """
+        table = self._table(cls)
+        where, params, rest = [], [], {}
+        for key, value in attributes.items():
+            if key != 'id' and key not in cls.INDEXES:
+                rest[key] = value
+            elif value is None:
+                where.append(f'"{key}" IS NULL')
+            else:
+                where.append(f'"{key}" = ?')
+                params.append(value)
+        query = f'SELECT data FROM "{table}"'
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        objs = [cls(**json.loads(data)) for (data,)
+                in self._connection().execute(query, params)]
+        return [obj for obj in objs
+                if all(getattr(obj, k) == v for k, v in rest.items())]
+
+
+_store = None
+
+
+def get_store() -> SQLiteStore:
+    """ Process-wide store on BASE_SQLITE_PATH (.db.sqlite3)
+    """
+    global _store
+    if _store is None:
+        _store = SQLiteStore(getenv("BASE_SQLITE_PATH", ".db.sqlite3"))
+    return _store
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """ User module
 """
-import hashlib
+from models import hashers
 from models.base import Base
 
 
@@ -9,6 +9,11 @@ class User(Base):
     """ User class
     """
 
+    INDEXES = ("email",)
+    __slots__ = ('email', '_password', 'first_name', 'last_name')
+    # hasher of new passwords, make_hasher() (PASSWORD_HASHER) if None
+    hasher: hashers.Hasher = None
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a User instance
         """
@@ -26,22 +31,45 @@ class User(Base):
 
     @password.setter
     def password(self, pwd: str):
-        """ Setter of a new password: encrypt in SHA256
+        """ Setter of a new password: hash it with the password hasher
         """
         if pwd is None or type(pwd) is not str:
             self._password = None
         else:
-            self._password = hashlib.sha256(pwd.encode()).hexdigest().lower()
+            hasher = self.password_hasher()
+            self._password = hashers.run(hasher, hasher.hash, pwd)
+
+    @classmethod
+    def password_hasher(cls) -> hashers.Hasher:
+        """ Hasher of new passwords
+        """
+        if cls.hasher is None:
+            cls.hasher = hashers.make_hasher()
+        return cls.hasher
 
     def is_valid_password(self, pwd: str) -> bool:
-        """ Validate a password
+        """ Validate a password against its hash, whichever hasher made
+        it; a valid password hashed by another hasher, or with weaker
+        settings, is hashed again and saved
         """
         if pwd is None or type(pwd) is not str:
             return False
-        if self.password is None:
+        hashed = self.password
+        if hashed is None:
+            return False
+        current = self.password_hasher()
+        hasher = hashers.hasher_of(hashed, current)
+        if hasher is None or \
+                not hashers.run(hasher, hasher.verify, pwd, hashed):
             return False
-        pwd_e = pwd.encode()
-        return hashlib.sha256(pwd_e).hexdigest().lower() == self.password
+        if hasher is not current or current.needs_rehash(hashed):
+            try:
+                self.password = pwd
+            except TimeoutError:
+                # hashing pool full: upgrade at a later login
+                return True
+            self.save()
+        return True
 
     def display_name(self) -> str:
         """ Display User name based on email/first_name/last_name
@@ -7,6 +7,9 @@ from models.base import Base
 class UserSession(Base):
     """UserSession class."""
 
+    INDEXES = ("session_id", "user_id")
+    __slots__ = ('user_id', 'session_id')
+
     def __init__(self, *args, **kwargs):
         """Constructor."""
         super().__init__(*args, **kwargs)
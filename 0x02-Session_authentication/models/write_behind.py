@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+""" Write-behind queue of a model class
+"""
+from typing import Dict, Tuple, TypeVar
+import atexit
+import os
+import threading
+import time
+
+
+class WriteBehind:
+    """ Saves and removes of the objects of a class, applied to the
+    store by a background thread with save_batch, batch_size objects at
+    a time: callers don't wait for the store, and an object written
+    several times between two flushes is written once (last write wins,
+    except that a save never replaces a queued remove: a removed object
+    stays removed). Pending writes are flushed at exit; a batch the
+    store rejects is queued again.
+    """
+
+    def __init__(self, cls: type, interval: float = 0.1,
+                 batch_size: int = 1000):
+        """ Initialize the queue of cls; the flusher waits interval
+        seconds after a write to collect the next ones
+        """
+        self.cls = cls
+        self.interval = interval
+        self.batch_size = batch_size
+        self.flushes = 0
+        self.written = 0
+        self.failures = 0
+        self._pending: Dict[str, Tuple[TypeVar('Base'), bool]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flusher_pid = None
+        atexit.register(self.flush)
+
+    def save(self, obj: TypeVar('Base')):
+        """ Queue obj.save()
+        """
+        self._put(obj, True)
+
+    def remove(self, obj: TypeVar('Base')):
+        """ Queue obj.remove()
+        """
+        self._put(obj, False)
+
+    def _put(self, obj: TypeVar('Base'), saved: bool):
+        """ Queue a write of obj and wake the flusher up
+        """
+        with self._lock:
+            queued = self._pending.get(obj.id)
+            if saved and queued is not None and not queued[1]:
+                return
+            self._pending[obj.id] = (obj, saved)
+        self._start_flusher()
+        self._wakeup.set()
+
+    def __len__(self) -> int:
+        """ Number of objects waiting to be written
+        """
+        return len(self._pending)
+
+    def flush(self):
+        """ Write all the pending objects now
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            writes = list(pending.values())
+            for start in range(0, len(writes), self.batch_size):
+                batch = writes[start:start + self.batch_size]
+                try:
+                    self.cls.save_batch(
+                        [obj for obj, saved in batch if saved],
+                        [obj for obj, saved in batch if not saved])
+                except Exception:
+                    self.failures += 1
+                    with self._lock:
+                        for obj, saved in writes[start:]:
+                            # keep writes queued meanwhile: they're newer
+                            self._pending.setdefault(obj.id, (obj, saved))
+                    raise
+                self.flushes += 1
+                self.written += len(batch)
+
+    def metrics(self) -> dict:
+        """ Pending writes, flushed batches, written objects and failed
+        batches so far
+        """
+        return {"pending": len(self._pending), "flushes": self.flushes,
+                "written": self.written, "failures": self.failures}
+
+    def _start_flusher(self):
+        """ Start the flusher thread of this process if not running
+        """
+        if self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_forever, daemon=True,
+                         name=f"{self.cls.__name__}-write-behind").start()
+
+    def _flush_forever(self):
+        """ Flush interval seconds after each wake-up
+        """
+        while True:
+            self._wakeup.wait()
+            time.sleep(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                # retried at the next wake-up
+                self._wakeup.set()
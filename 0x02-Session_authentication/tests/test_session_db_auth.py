@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+""" SessionDBAuth tests: run from the project folder with
+python -m unittest discover tests
+"""
+import os
+import tempfile
+import time
+import unittest
+
+os.environ.setdefault("SESSION_NAME", "_my_session_id")
+os.chdir(tempfile.mkdtemp())
+
+from api.v1.auth.session_db_auth import SessionDBAuth  # noqa: E402
+from flask import Flask, request  # noqa: E402
+from models.user import User  # noqa: E402
+from models.user_session import UserSession  # noqa: E402
+
+# request contexts only: the API app picks its auth from AUTH_TYPE
+app = Flask(__name__)
+
+
+class TestSessionDBAuth(unittest.TestCase):
+    """ Logins and logouts written behind
+    """
+
+    def setUp(self):
+        """ One user
+        """
+        self.user = User(email="session@example.com")
+        self.user.save()
+
+    def current_user(self, auth: SessionDBAuth, session_id: str):
+        """ current_user of a request with session_id in its cookie
+        """
+        cookie = "{}={}".format(os.environ["SESSION_NAME"], session_id)
+        with app.test_request_context(headers={"Cookie": cookie}):
+            return auth.current_user(request)
+
+    def destroy_session(self, auth: SessionDBAuth, session_id: str) -> bool:
+        """ destroy_session of a request with session_id in its cookie
+        """
+        cookie = "{}={}".format(os.environ["SESSION_NAME"], session_id)
+        with app.test_request_context(headers={"Cookie": cookie}):
+            return auth.destroy_session(request)
+
+    def test_logout_then_request(self):
+        """ A request right after a logout, before and after the flush of
+        the remove, is not authenticated
+        """
+        auth = SessionDBAuth()
+        session_id = auth.create_session(self.user.id)
+        auth.writes.flush()
+        auth.cache.pop(session_id)
+        self.assertEqual(self.current_user(auth, session_id), self.user)
+        self.assertTrue(self.destroy_session(auth, session_id))
+        self.assertIsNone(self.current_user(auth, session_id))
+        auth.writes.flush()
+        self.assertIsNone(self.current_user(auth, session_id))
+        self.assertEqual(
+            UserSession.search({'session_id': session_id}), [])
+
+    def test_renewal_keeps_remove(self):
+        """ A sliding renewal doesn't bring a logged out session back
+        """
+        os.environ.update(SESSION_SLIDING="1", SESSION_DURATION="600",
+                          SESSION_TOUCH_INTERVAL="0.01")
+        try:
+            auth = SessionDBAuth()
+        finally:
+            for name in ("SESSION_SLIDING", "SESSION_DURATION",
+                         "SESSION_TOUCH_INTERVAL"):
+                os.environ.pop(name)
+        session_id = auth.create_session(self.user.id)
+        auth.writes.flush()
+        user_session = auth.user_session(session_id)
+        self.assertTrue(self.destroy_session(auth, session_id))
+        time.sleep(0.02)
+        auth.writes.save(user_session)
+        self.assertIsNone(self.current_user(auth, session_id))
+        auth.writes.flush()
+        self.assertEqual(
+            UserSession.search({'session_id': session_id}), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+""" Binary snapshot tests: run from the project folder with
+python -m unittest discover tests
+"""
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from models import snapshot
+from models.user import User
+
+
+class TestSnapshot(unittest.TestCase):
+    """ Snapshots written and read back
+    """
+
+    def setUp(self):
+        """ Work in an empty folder
+        """
+        self.cwd = os.getcwd()
+        os.chdir(tempfile.mkdtemp())
+
+    def tearDown(self):
+        """ Back to the previous folder
+        """
+        os.environ.pop("BASE_SNAPSHOT", None)
+        os.chdir(self.cwd)
+
+    def test_round_trip(self):
+        """ Strings, integers and None come back as written
+        """
+        rows = [{"id": "a", "name": "x", "n": 0},
+                {"id": "b", "name": None, "n": 12},
+                {"id": "c", "name": "", "n": None}]
+        self.assertTrue(snapshot.dump("rows.bin", rows))
+        count, columns = snapshot.load("rows.bin")
+        self.assertEqual(count, 3)
+        self.assertEqual(columns, {"id": ["a", "b", "c"],
+                                   "name": ["x", None, ""],
+                                   "n": [0, 12, None]})
+
+    def test_refused(self):
+        """ Mixed, boolean and NUL columns are not written
+        """
+        for rows in ([{"v": "a"}, {"v": 1}], [{"v": True}],
+                     [{"v": "a\0b"}]):
+            with self.subTest(rows=rows):
+                self.assertFalse(snapshot.dump("rows.bin", rows))
+                self.assertFalse(os.path.exists("rows.bin"))
+
+    def test_users_round_trip(self):
+        """ Users saved with BASE_SNAPSHOT=binary load back from the
+        snapshot with their revision
+        """
+        os.environ["BASE_SNAPSHOT"] = "binary"
+        User.load_from_file()
+        user = User(email="snapshot@example.com")
+        user.save()
+        user.save()
+        self.assertTrue(os.path.exists(".db_User.bin"))
+        os.remove(".db_User.json")
+        User.load_from_file()
+        loaded = User.get(user.id)
+        self.assertEqual(loaded.email, "snapshot@example.com")
+        self.assertEqual(loaded.revision, 2)
+        loaded.save()
+        self.assertEqual(loaded.revision, 3)
+
+    def test_concurrent_saves(self):
+        """ Saves of several threads each rewrite the snapshot without
+        failing, and leave it whole with every user
+        """
+        User.load_from_file()
+        errors = []
+
+        def save_users(n: int):
+            """ Save 50 new users
+            """
+            try:
+                for i in range(50):
+                    User(email="{}-{}@example.com".format(n, i)).save()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=save_users, args=(n,))
+                   for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(os.listdir("."), [".db_User.json"])
+        with open(".db_User.json") as f:
+            self.assertEqual(len(json.load(f)), 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+""" TokenAuth tests: run from the project folder with
+python -m unittest discover tests
+"""
+import os
+import tempfile
+import unittest
+
+os.environ["AUTH_TYPE"] = "token_auth"
+os.environ["AUTH_TOKEN_SECRET"] = "test-secret"
+os.environ.setdefault("SESSION_NAME", "_my_session_id")
+os.chdir(tempfile.mkdtemp())
+
+from api.v1.app import app, auth  # noqa: E402
+from api.v1.auth.token_auth import TokenAuth  # noqa: E402
+from models.user import User  # noqa: E402
+
+
+class TestTokenAuth(unittest.TestCase):
+    """ Signed tokens, valid and malformed
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """ One user and a token of it
+        """
+        cls.user = User(email="token@example.com")
+        cls.user.save()
+        cls.auth = TokenAuth()
+        cls.token = cls.auth.create_session(cls.user.id)
+        cls.client = app.test_client()
+
+    def test_valid_token(self):
+        """ A signed token resolves to its user
+        """
+        self.assertEqual(self.auth.user_id_for_session_id(self.token),
+                         self.user.id)
+        response = self.client.get("/api/v1/users/me", headers={
+            "Authorization": "Bearer " + self.token})
+        self.assertEqual(response.status_code, 200)
+
+    def test_malformed_tokens(self):
+        """ Malformed, tampered and non-ASCII tokens are rejected
+        """
+        for token in ["", "abc", "abc.é", "é", self.token + "é",
+                      self.token[:-1] + "é", "a.b.c.d.e",
+                      self.token.replace(self.user.id, "other", 1)]:
+            with self.subTest(token=token):
+                self.assertIsNone(self.auth.verify(token))
+
+    def test_non_ascii_bearer(self):
+        """ A non-ASCII Bearer token is forbidden, not an error
+        """
+        response = self.client.get("/api/v1/users/me", headers={
+            "Authorization": "Bearer abc.é"})
+        self.assertEqual(response.status_code, 403)
+
+    def test_removed_user(self):
+        """ The token of a removed user is refused on the next request,
+        though the user is cached
+        """
+        user = User(email="removed@example.com")
+        user.save()
+        headers = {"Authorization": "Bearer " +
+                   self.auth.create_session(user.id)}
+        self.assertEqual(
+            self.client.get("/api/v1/users/me", headers=headers).status_code,
+            200)
+        user.remove()
+        self.assertEqual(
+            self.client.get("/api/v1/users/me", headers=headers).status_code,
+            403)
+        self.assertIsNone(auth.users.get(user.id))
+
+
+if __name__ == "__main__":
+    unittest.main()
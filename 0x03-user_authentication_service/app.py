@@ -3,12 +3,28 @@
 
 from flask import Flask, jsonify, request, abort, make_response, redirect
 from auth import Auth
+from typing import Optional
 
 # Initialize Flask app and Auth object
 app = Flask(__name__)
 AUTH = Auth()
 
 
+@app.teardown_appcontext
+def end_request(error: Optional[BaseException]) -> None:
+    """ Release the database session of the request, rolled back if the
+    request failed """
+    AUTH.end_request(error)
+
+
+@app.route('/internal/pool', methods=['GET'])
+def pool_stats():
+    """ Database connection pool statistics, for local requests only """
+    if request.remote_addr not in ("127.0.0.1", "::1"):
+        abort(403)
+    return jsonify(AUTH.pool_stats()), 200
+
+
 @app.route('/', methods=['GET'])
 def welcome():
     """ Return a JSON welcome message """
@@ -4,7 +4,7 @@
 import bcrypt
 from db import DB
 from user import User
-from typing import Union
+from typing import Dict, Optional, Union
 import uuid
 
 
@@ -51,6 +51,14 @@ class Auth:
         if user:
             self._db.update_user(user.id, session_id=None)
 
+    def end_request(self, error: Optional[BaseException] = None) -> None:
+        """ Release the database session of the request """
+        self._db.close_session(error)
+
+    def pool_stats(self) -> Dict[str, float]:
+        """ Database connection pool statistics """
+        return self._db.pool_stats()
+
     def get_reset_password_token(self, email: str) -> str:
         """ Generate a reset password token """
         user = self._db.find_user_by(email=email)
@@ -1,46 +1,131 @@
 #!/usr/bin/env python3
 """ DB module for managing database """
 
+from contextlib import contextmanager
+from os import getenv
 from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.orm.session import Session
 from sqlalchemy.exc import InvalidRequestError, SQLAlchemyError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.orm.session import Session
+from sqlalchemy.pool import QueuePool
 from user import Base, User
-from typing import Optional, Dict
+from typing import Dict, Iterator, Optional
+import threading
+import time
 
 VALID_FIELDS = ['id', 'email', 'hashed_password', 'session_id', 'reset_token']
 
+
+class TimedQueuePool(QueuePool):
+    """ QueuePool that records how long checkouts wait for a connection
+    and how many give up after the pool timeout """
+
+    def __init__(self, *args, **kwargs) -> None:
+        """ Initialize the pool and its wait counters """
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._stats_lock = threading.Lock()
+
+    def _do_get(self):
+        """ Get a connection from the pool, timing the wait """
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        wait = time.perf_counter() - start
+        with self._stats_lock:
+            self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+        return connection
+
+
 class DB:
-    """ DB class for interacting with the database """
+    """ DB class for interacting with the database.
+    Each thread gets its own session (a scoped_session), closed at the
+    end of each request by close_session; sessions check connections
+    out of a pool of DB_POOL_SIZE connections (5), DB_MAX_OVERFLOW more
+    under load (10), waiting at most DB_POOL_TIMEOUT seconds (30) """
 
     def __init__(self) -> None:
         """ Initialize a new DB instance """
-        self._engine = create_engine("sqlite:///a.db", echo=True)
+        url = getenv("DB_URL", "sqlite:///a.db")
+        connect_args = {}
+        if url.startswith("sqlite"):
+            # pooled connections are used by one thread at a time, but
+            # not always by the thread that opened them
+            connect_args["check_same_thread"] = False
+        self._max_overflow = int(getenv("DB_MAX_OVERFLOW", 10))
+        self._engine = create_engine(
+            url, echo=True, poolclass=TimedQueuePool,
+            pool_size=int(getenv("DB_POOL_SIZE", 5)),
+            max_overflow=self._max_overflow,
+            pool_timeout=float(getenv("DB_POOL_TIMEOUT", 30)),
+            connect_args=connect_args)
         Base.metadata.drop_all(self._engine)
         Base.metadata.create_all(self._engine)
-        self.__session: Optional[Session] = None
+        # objects stay usable once their session is closed
+        self.__session = scoped_session(
+            sessionmaker(bind=self._engine, expire_on_commit=False))
 
     @property
     def _session(self) -> Session:
-        """ Memoized session object """
-        if self.__session is None:
-            DBSession = sessionmaker(bind=self._engine)
-            self.__session = DBSession()
-        return self.__session
+        """ Session of the current thread """
+        return self.__session()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[Session]:
+        """ Session of the current thread, committed at the end of the
+        block or rolled back if it raises """
+        session = self._session
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+
+    def close_session(self, error: Optional[BaseException] = None) -> None:
+        """ End the session of the current thread, rolling back what it
+        didn't commit (all of it if error is set), and return its
+        connection to the pool """
+        if error is not None:
+            self.__session().rollback()
+        self.__session.remove()
+
+    def pool_stats(self) -> Dict[str, float]:
+        """ Connection pool statistics: connections checked out and idle,
+        overflow in use, checkouts so far, checkouts that timed out and
+        how long checkouts waited """
+        pool = self._engine.pool
+        checkouts = pool.checkouts
+        return {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(0, pool.overflow()),
+            "max_overflow": self._max_overflow,
+            "checkouts": checkouts,
+            "timeouts": pool.timeouts,
+            "wait_avg_ms": pool.wait_total / checkouts * 1000
+            if checkouts else 0.0,
+            "wait_max_ms": pool.wait_max * 1000,
+        }
 
     def add_user(self, email: str, hashed_password: str) -> User:
         """ Adds a new user to the Database """
         if not email or not hashed_password:
             raise ValueError("Email and password cannot be empty")
         user = User(email=email, hashed_password=hashed_password)
-        session = self._session
-        try:
+        with self._transaction() as session:
             session.add(user)
-            session.commit()
-        except SQLAlchemyError as e:
-            session.rollback()
-            raise e
         return user
 
     def find_user_by(self, **kwargs) -> User:
@@ -55,14 +140,9 @@ class DB:
 
     def update_user(self, user_id: int, **kwargs) -> None:
         """ Update a user in the database """
-        session = self._session
-        user = self.find_user_by(id=user_id)
-        for key, value in kwargs.items():
-            if key not in VALID_FIELDS:
-                raise ValueError(f"Invalid field: {key}")
-            setattr(user, key, value)
-        try:
-            session.commit()
-        except SQLAlchemyError as e:
-            session.rollback()
-            raise e
+        with self._transaction():
+            user = self.find_user_by(id=user_id)
+            for key, value in kwargs.items():
+                if key not in VALID_FIELDS:
+                    raise ValueError(f"Invalid field: {key}")
+                setattr(user, key, value)